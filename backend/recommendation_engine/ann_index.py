@@ -0,0 +1,287 @@
+"""Approximate nearest-neighbour indexes over embedding matrices.
+
+IVFIndex is a pure-numpy inverted-file index: vectors are partitioned by a
+spherical k-means coarse quantizer and a query only scans the n_probe
+partitions whose centroids are closest to it. Raising n_probe trades latency
+for recall; n_probe == n_lists is an exact search.
+
+AnnoyIndexWrapper wraps Spotify's Annoy (as prototyped in the notebook) when
+the annoy package is installed.
+
+QuantizedIndex keeps only compressed codes (float16, int8 or product
+quantization, see quantization.py) in memory and scans all of them; the best
+rerank * k candidates are then re-scored on the exact vectors, which are
+usually the memory-mapped embedding store, so only those rows are paged in.
+
+All indexes score by cosine similarity and are saved to a directory that is
+memory-mapped back on load.
+"""
+import json
+import os
+
+import numpy as np
+
+from embedding_store import atomic_directory
+from quantization import CODECS, create_codec, load_codec
+
+try:
+    from annoy import AnnoyIndex
+except ImportError:
+    AnnoyIndex = None
+
+INDEX_META_FILE = 'index.json'
+
+
+def normalize_rows(vectors):
+    """L2-normalize rows as float32, leaving all-zero rows at zero"""
+    return l2_normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def l2_normalize(vectors):
+    """L2-normalize rows keeping a float dtype (other dtypes become float64), leaving all-zero rows at zero"""
+    vectors = np.asarray(vectors)
+    if vectors.dtype.kind != 'f':
+        vectors = vectors.astype(float)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, random_seed=42, chunk_size=65536):
+    """Cluster L2-normalized vectors by cosine similarity"""
+    rng = np.random.default_rng(random_seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(vectors, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Re-seed empty clusters with random points so every list stays usable
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign_to_centroids(vectors, centroids, chunk_size=65536):
+    """Index of the most similar centroid for every vector"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """Inverted-file index scored by cosine similarity"""
+
+    kind = 'ivf'
+
+    def __init__(self, centroids, vectors, ids, offsets, n_probe=8):
+        self.centroids = centroids
+        # Vectors are stored normalized and grouped by list so each probe is one contiguous slice
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.n_probe = n_probe
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, vectors, ids=None, n_lists=None, n_probe=8, train_size=100000, random_seed=42):
+        """Train the coarse quantizer on a sample and bucket every vector"""
+        vectors = normalize_rows(vectors)
+        ids = np.arange(len(vectors), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        if not len(vectors):
+            # An empty store (every image failed, or everything was removed) has no lists to probe
+            return cls(np.zeros((0, vectors.shape[-1]), dtype=np.float32), vectors, ids,
+                       np.zeros(1, dtype=np.int64), n_probe=n_probe)
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        rng = np.random.default_rng(random_seed)
+        sample_size = min(len(vectors), max(train_size, n_lists))
+        sample = vectors[np.sort(rng.choice(len(vectors), size=sample_size, replace=False))]
+        centroids = spherical_kmeans(sample, n_lists, random_seed=random_seed)
+
+        assignments = assign_to_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=offsets[1:])
+        return cls(centroids, vectors[order], ids[order], offsets, n_probe=n_probe)
+
+    def search(self, query, k=5, n_probe=None):
+        """Return (ids, similarities) of the k best matches for a single query"""
+        query = normalize_rows(query.reshape(1, -1))[0]
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+
+        probes = top_k(self.centroids @ query, n_probe)
+        ranges = [(self.offsets[p], self.offsets[p + 1]) for p in probes]
+        candidates = np.concatenate([np.arange(start, end) for start, end in ranges]) if ranges else np.zeros(0, dtype=np.int64)
+        if not len(candidates):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        scores = np.concatenate([self.vectors[start:end] @ query for start, end in ranges])
+        best = top_k(scores, k)
+        return np.asarray(self.ids[candidates[best]]), scores[best]
+
+    def save(self, path):
+        np.save(os.path.join(path, 'centroids.npy'), self.centroids)
+        np.save(os.path.join(path, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+
+    @classmethod
+    def load(cls, path, n_probe=8):
+        return cls(np.load(os.path.join(path, 'centroids.npy')),
+                   np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'ids.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'offsets.npy')),
+                   n_probe=n_probe)
+
+
+class QuantizedIndex:
+    """Exhaustive scan over quantized vectors, re-ranked on exact vectors"""
+
+    def __init__(self, codec, codes, ids, exact=None, rerank=4):
+        self.codec = codec
+        self.kind = codec.name
+        self.codes = codes
+        self.ids = ids
+        # Exact vectors indexed by id (e.g. the store's memmap); without them results are not re-ranked
+        self.exact = exact
+        self.rerank = rerank
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Resident size of the codes, ids and codec tables"""
+        return self.codes.nbytes + self.ids.nbytes + sum(array.nbytes for array in self.codec.arrays().values())
+
+    @classmethod
+    def build(cls, vectors, ids=None, quantization='int8', exact=None, rerank=4, **codec_params):
+        vectors = normalize_rows(vectors)
+        ids = np.arange(len(vectors), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        codec = create_codec(quantization, **codec_params).fit(vectors)
+        return cls(codec, codec.encode(vectors), ids, exact=exact, rerank=rerank)
+
+    def search(self, query, k=5, rerank=None):
+        """Return (ids, similarities) of the k best matches for a single query"""
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+        rerank = self.rerank if rerank is None else rerank
+        scores = self.codec.scores(query, self.codes)
+        if self.exact is None or not rerank:
+            best = top_k(scores, k)
+            return self.ids[best], scores[best]
+
+        candidates = top_k(scores, k * rerank)
+        candidate_ids = self.ids[candidates]
+        # Sorted reads keep memmap access sequential
+        order = np.argsort(candidate_ids)
+        exact_scores = np.empty(len(candidates), dtype=np.float32)
+        exact_scores[order] = normalize_rows(self.exact[candidate_ids[order]]) @ query
+        best = top_k(exact_scores, k)
+        return candidate_ids[best], exact_scores[best]
+
+    def save(self, path):
+        np.save(os.path.join(path, 'codes.npy'), self.codes)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        np.savez(os.path.join(path, 'codec.npz'), **self.codec.arrays())
+
+    @classmethod
+    def load(cls, path, kind, exact=None, rerank=4):
+        with np.load(os.path.join(path, 'codec.npz')) as arrays:
+            codec = load_codec(kind, dict(arrays))
+        return cls(codec, np.load(os.path.join(path, 'codes.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'ids.npy'), mmap_mode='r'), exact=exact, rerank=rerank)
+
+
+class AnnoyIndexWrapper:
+    """Annoy forest scored by cosine similarity; search_k tunes recall"""
+
+    kind = 'annoy'
+
+    def __init__(self, index, ids, search_k=-1):
+        self.index = index
+        self.ids = ids
+        self.search_k = search_k
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, vectors, ids=None, n_trees=100, search_k=-1):
+        if AnnoyIndex is None:
+            raise ImportError("The annoy package is required for the 'annoy' index (pip install annoy)")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.arange(len(vectors), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        index = AnnoyIndex(vectors.shape[1], 'angular')
+        for i, vector in enumerate(vectors):
+            index.add_item(i, vector)
+        index.build(n_trees)
+        return cls(index, ids, search_k=search_k)
+
+    def search(self, query, k=5, search_k=None):
+        positions, distances = self.index.get_nns_by_vector(
+            np.asarray(query, dtype=np.float32), k,
+            search_k=self.search_k if search_k is None else search_k, include_distances=True)
+        # Annoy's angular distance is sqrt(2 - 2 * cos)
+        similarities = 1 - np.square(np.asarray(distances, dtype=np.float32)) / 2
+        return self.ids[np.asarray(positions, dtype=np.int64)], similarities
+
+    def save(self, path):
+        self.index.save(os.path.join(path, 'annoy.ann'))
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+
+    @classmethod
+    def load(cls, path, dim, search_k=-1):
+        if AnnoyIndex is None:
+            raise ImportError("The annoy package is required for the 'annoy' index (pip install annoy)")
+        index = AnnoyIndex(dim, 'angular')
+        index.load(os.path.join(path, 'annoy.ann'))
+        return cls(index, np.load(os.path.join(path, 'ids.npy')), search_k=search_k)
+
+
+def save_index(index, path, fingerprint):
+    """Write an index directory, tagged with the fingerprint of the data it was built from"""
+    with atomic_directory(path) as tmp_path:
+        index.save(tmp_path)
+        with open(os.path.join(tmp_path, INDEX_META_FILE), 'w') as f:
+            json.dump({'kind': index.kind, 'fingerprint': fingerprint}, f)
+
+
+def load_index(path, fingerprint, kind, dim, **params):
+    """Load a saved index, or return None if it is missing, of another kind or built from other data"""
+    path = str(path)
+    meta_path = os.path.join(path, INDEX_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('kind') != kind or meta.get('fingerprint') != fingerprint:
+        return None
+    if kind == 'annoy':
+        return AnnoyIndexWrapper.load(path, dim, search_k=params.get('search_k', -1))
+    if kind in CODECS:
+        return QuantizedIndex.load(path, kind, exact=params.get('exact'), rerank=params.get('rerank', 4))
+    return IVFIndex.load(path, n_probe=params.get('n_probe', 8))
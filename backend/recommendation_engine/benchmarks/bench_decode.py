@@ -0,0 +1,88 @@
+"""Per-image cost of the image preprocessing paths.
+
+Times the full decode, the reduced-resolution JPEG decode (--fast_decode)
+and crop cache hits on generated multi-megapixel photos, or on the images
+under --data_dir, and reports the parity of the fast decode: the lowest
+cosine similarity between ResNet-18 embeddings of fast and full decodes.
+
+    python benchmarks/bench_decode.py --images 32 --size 4000 3000
+    python benchmarks/bench_decode.py --data_dir img --pretrained
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_embeddings import ImageDataset, get_transform, load_model, scan_images  # noqa: E402
+from image_preprocessing import CropCache  # noqa: E402
+
+
+def write_photos(image_dir, n_images, size=(4000, 3000), random_seed=42):
+    """Smooth random JPEGs with a little grain, closer to product photos than pure noise"""
+    from PIL import Image
+
+    rng = np.random.default_rng(random_seed)
+    os.makedirs(image_dir, exist_ok=True)
+    image_paths = []
+    for i in range(n_images):
+        coarse = Image.fromarray(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8))
+        pixels = np.asarray(coarse.resize(size, Image.BICUBIC), dtype=np.int16)
+        pixels = pixels + rng.integers(-8, 9, pixels.shape, dtype=np.int16)
+        path = os.path.join(image_dir, f'photo_{i}.jpg')
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=90)
+        image_paths.append(path)
+    return image_paths
+
+
+def decode_ms(dataset, repeat):
+    """Best-of-repeat milliseconds per image to produce the input tensors"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        images = [dataset[i][0] for i in range(len(dataset))]
+        best = min(best, time.perf_counter() - start)
+    return 1000 * best / len(dataset), torch.stack(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark full, reduced-resolution and cached image decoding')
+    parser.add_argument('--data_dir', default=None, help='Image directory (generated photos if not given)')
+    parser.add_argument('--images', type=int, default=16, help='Images to generate')
+    parser.add_argument('--size', type=int, nargs=2, default=[4000, 3000], help='Width and height of generated photos')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes; the best counts')
+    parser.add_argument('--pretrained', action='store_true', help='Download and use the pretrained weights')
+    args = parser.parse_args()
+
+    transform = get_transform()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.data_dir:
+            image_paths, _ = scan_images(args.data_dir)
+        else:
+            image_paths = write_photos(os.path.join(tmp_dir, 'img'), args.images, tuple(args.size))
+        print(f"{len(image_paths)} images")
+
+        full_ms, full = decode_ms(ImageDataset(image_paths, transform), args.repeat)
+        fast_ms, fast = decode_ms(ImageDataset(image_paths, transform, fast_decode=True), args.repeat)
+        cache = CropCache(os.path.join(tmp_dir, 'crops'), fast_decode=True)
+        cached = ImageDataset(image_paths, transform, crop_cache=cache)
+        miss_ms, _ = decode_ms(cached, 1)
+        hit_ms, hits = decode_ms(cached, args.repeat)
+
+    model = load_model(args.pretrained)
+    with torch.inference_mode():
+        parity = float(torch.nn.functional.cosine_similarity(model(fast).flatten(1), model(full).flatten(1)).min())
+    print(f"{'full decode':<20} {full_ms:8.2f} ms/image")
+    print(f"{'fast decode':<20} {fast_ms:8.2f} ms/image  {full_ms / fast_ms:5.1f}x  "
+          f"min cosine to full decode {parity:.4f}")
+    print(f"{'crop cache (miss)':<20} {miss_ms:8.2f} ms/image")
+    print(f"{'crop cache (hit)':<20} {hit_ms:8.2f} ms/image  {full_ms / hit_ms:5.1f}x  "
+          f"identical to fast decode: {bool(torch.equal(hits, fast))}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Per-image latency of the ResNet-18 inference backends.
+
+Times every backend in inference.py at batch size 1 (the query path) and
+--batch_size (catalog embedding) on generated JPEGs, or on the images under
+--data_dir, and reports the speedup over eager and the parity (lowest
+cosine similarity to the eager embeddings).
+
+    python benchmarks/bench_inference.py --backends eager channels_last torchscript int8
+    python benchmarks/bench_inference.py --data_dir img --pretrained --threads 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_pipeline import write_images  # noqa: E402
+from generate_embeddings import get_transform, load_model, sample_images, scan_images  # noqa: E402
+from inference import BACKENDS, check_parity, optimize_model  # noqa: E402
+
+
+def latency_ms(model, images, batch_size, repeat):
+    """Best-of-repeat milliseconds per image, after one warm-up pass"""
+    batches = [images[start:start + batch_size] for start in range(0, len(images), batch_size)]
+    best = float('inf')
+    with torch.inference_mode():
+        model(batches[0])
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for batch in batches:
+                model(batch)
+            best = min(best, time.perf_counter() - start)
+    return 1000 * best / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the CNN inference backends')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS), help='Backends to time')
+    parser.add_argument('--data_dir', default=None, help='Image directory (generated JPEGs if not given)')
+    parser.add_argument('--images', type=int, default=64, help='Images to time')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size for the batched measurement')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes; the best counts')
+    parser.add_argument('--threads', type=int, default=None, help='torch threads')
+    parser.add_argument('--pretrained', action='store_true', help='Download and use the pretrained weights')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    transform = get_transform()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.data_dir:
+            image_paths, _ = scan_images(args.data_dir)
+        else:
+            image_paths = write_images(tmp_dir, args.images)
+        images = sample_images(image_paths, transform, args.images)
+    calibration = images[:max(1, len(images) // 2)]
+
+    reference = load_model(args.pretrained)
+    eager = None
+    print(f"{len(images)} images, {torch.get_num_threads()} threads")
+    for backend in args.backends:
+        try:
+            model = optimize_model(reference, backend, calibration)
+        except ImportError as e:
+            print(f"{backend:<14} skipped: {e}")
+            continue
+        parity = check_parity(model, reference, images, threshold=-1)
+        single = latency_ms(model, images[:min(len(images), 16)], 1, args.repeat)
+        batched = latency_ms(model, images, args.batch_size, args.repeat)
+        if backend == 'eager':
+            eager = (single, batched)
+        speedup = f"  {eager[0] / single:4.1f}x / {eager[1] / batched:4.1f}x vs eager" if eager else ''
+        print(f"{backend:<14} batch 1 {single:7.2f} ms/image  batch {args.batch_size} {batched:7.2f} ms/image  "
+              f"min cosine {parity:.4f}{speedup}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Row-wise vs columnar ingestion in process_ecommerce_data.
+
+Times the steps that used to run per row (category/feature strings, the
+category hierarchy and graph construction) against a copy of the original
+row-wise code, and checks that both produce the same graph.
+
+    python benchmarks/bench_ingestion.py --rows 10000 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from product_recommender import PinSageHierarchical, _join_columns  # noqa: E402
+from synthetic import make_catalog  # noqa: E402
+
+CATEGORICAL_COLS = ['Brand', 'Category', 'Season', 'Holiday', 'Gender', 'Location']
+
+
+def prepare(n_rows, embedding_dim=16):
+    df = make_catalog(n_rows)
+    df['product_id'] = df['product_id'].astype(str)
+    rng = np.random.default_rng(0)
+    df['main_category'] = rng.integers(0, 10, n_rows)
+    df['sub_category'] = rng.integers(0, 3, n_rows)
+    text_cols = [col for col in df.select_dtypes(include=[object]).columns if col != 'product_id']
+    features = rng.standard_normal((n_rows, embedding_dim))
+    return df, text_cols, features
+
+
+def rowwise(df, text_cols, pin_features):
+    """The original per-row implementation"""
+    df = df.copy()
+    cat_cols = [col for col in CATEGORICAL_COLS if col in df.columns]
+    df['category_string'] = df[cat_cols].apply(
+        lambda row: ' | '.join([f"{col}:{str(row[col])}" for col in cat_cols if pd.notna(row[col])]), axis=1)
+    df['feature_string'] = df[text_cols].apply(
+        lambda row: ' '.join([str(row[col]) for col in text_cols if pd.notna(row[col])]), axis=1)
+    df['category_hierarchy'] = df.apply(
+        lambda row: [f"category_{row['main_category']}",
+                     f"subcategory_{row['main_category']}_{row['sub_category']}"], axis=1)
+
+    graph = nx.DiGraph()
+    for i, row in df.iterrows():
+        graph.add_node(f"pin_{row['product_id']}", type="pin", features=pin_features[i])
+    board_hierarchy = {}
+    for i, row in df.iterrows():
+        pin_id = f"pin_{row['product_id']}"
+        parent_board = None
+        for level, category in enumerate(row['category_hierarchy']):
+            board_id = f"board_{level}_{category}"
+            if board_id not in board_hierarchy:
+                board_hierarchy[board_id] = {"pins": [], "sub_boards": [], "level": level}
+                graph.add_node(board_id, type="board", level=level, name=category)
+            board_hierarchy[board_id]["pins"].append(pin_id)
+            graph.add_edge(board_id, pin_id, relation="contains")
+            if parent_board:
+                if board_id not in board_hierarchy[parent_board]["sub_boards"]:
+                    board_hierarchy[parent_board]["sub_boards"].append(board_id)
+                graph.add_edge(parent_board, board_id, relation="parent")
+            parent_board = board_id
+    return df, graph, board_hierarchy
+
+
+def columnar(df, text_cols, pin_features):
+    """The vectorized implementation used by process_ecommerce_data"""
+    df = df.copy()
+    cat_cols = [col for col in CATEGORICAL_COLS if col in df.columns]
+    df['category_string'] = _join_columns(df, cat_cols, ' | ', with_names=True)
+    df['feature_string'] = _join_columns(df, text_cols, ' ')
+    main_names = 'category_' + df['main_category'].astype(str)
+    sub_names = 'subcategory_' + df['main_category'].astype(str) + '_' + df['sub_category'].astype(str)
+    df['category_hierarchy'] = [list(pair) for pair in zip(main_names, sub_names)]
+
+    model = PinSageHierarchical(embedding_dim=pin_features.shape[1])
+    pin_ids = ('pin_' + df['product_id'].astype(str)).to_numpy(dtype=object)
+    model.graph.add_nodes_from(
+        (pin_id, {'type': 'pin', 'features': features}) for pin_id, features in zip(pin_ids, pin_features))
+    board_hierarchy = model._add_board_hierarchy(
+        pin_ids, main_names.to_numpy(dtype=object), sub_names.to_numpy(dtype=object))
+    return df, model.graph, board_hierarchy
+
+
+def same_graph(a, b):
+    if list(a.nodes) != list(b.nodes) or list(a.edges(data=True)) != list(b.edges(data=True)):
+        return False
+    return all(a.nodes[n].get('level') == b.nodes[n].get('level') and a.nodes[n].get('name') == b.nodes[n].get('name')
+               for n in a.nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark row-wise vs columnar catalog ingestion')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Catalog sizes to time')
+    args = parser.parse_args()
+
+    for n_rows in args.rows:
+        df, text_cols, features = prepare(n_rows)
+
+        start = time.perf_counter()
+        df_row, graph_row, hierarchy_row = rowwise(df, text_cols, features)
+        rowwise_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df_col, graph_col, hierarchy_col = columnar(df, text_cols, features)
+        columnar_time = time.perf_counter() - start
+
+        identical = (same_graph(graph_row, graph_col) and hierarchy_row == hierarchy_col and
+                     all(df_row[col].tolist() == df_col[col].tolist()
+                         for col in ['category_string', 'feature_string', 'category_hierarchy']))
+        print(f"{n_rows:>9} rows  row-wise {rowwise_time:8.2f}s  columnar {columnar_time:7.2f}s  "
+              f"speedup {rowwise_time / columnar_time:5.1f}x  identical={identical}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Recall and latency of PinSageHierarchical.recommend_similar_pins.
+
+Builds a model on a synthetic catalog and compares the sub-category IVF
+search at each --n_probe against a brute-force scan over every pin.
+
+    python benchmarks/bench_pin_search.py --rows 100000 --n_probe 1 2 4 8 --top_k 10
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from product_recommender import PinSageHierarchical  # noqa: E402
+from synthetic import make_catalog  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pin recommendations against brute force')
+    parser.add_argument('--rows', type=int, default=100000, help='Synthetic catalog size')
+    parser.add_argument('--n_probe', type=int, nargs='+', default=[1, 2, 4, 8], help='Sub-category boards to probe')
+    parser.add_argument('--top_k', type=int, default=10, help='Recommendations per query')
+    parser.add_argument('--queries', type=int, default=500, help='Sampled query pins')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    model = PinSageHierarchical()
+    model.process_ecommerce_data(make_catalog(args.rows))
+    model.generate_embeddings(alpha=0.6, max_depth=3)
+
+    start = time.perf_counter()
+    model._build_pin_index()
+    print(f"{args.rows} pins in {model._pin_index.n_lists} sub-category lists, "
+          f"index built in {time.perf_counter() - start:.2f}s")
+
+    results = model.evaluate_pin_recall(args.n_probe, args.top_k, args.queries)
+    print(f"brute force          {results['brute_force']['ms_per_query']:8.3f} ms/query")
+    for n_probe, result in results['n_probe'].items():
+        print(f"n_probe={n_probe:<4} recall@{args.top_k} {result['recall']:.3f}  {result['ms_per_query']:8.3f} ms/query")
+
+if __name__ == '__main__':
+    main()
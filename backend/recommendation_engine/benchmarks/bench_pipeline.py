@@ -0,0 +1,262 @@
+"""End-to-end benchmark of the recommendation engine hot paths.
+
+Builds synthetic catalogs (see synthetic.py, no network or kagglehub) and
+times each step of the board pipeline: load_ecommerce_dataset,
+process_ecommerce_data, generate_embeddings, cluster_boards,
+recommend_similar_boards and evaluate_recommendations. With --images it also
+times the image pipeline on generated JPEGs: decoding, batched ResNet-18
+embedding (random weights, so nothing is downloaded), writing the embedding
+store, building the IVF index and searching it.
+
+Every stage records wall time, throughput and peak RSS. Each catalog size
+runs in a fresh process, so peak RSS is the high-water mark of that run up
+to the end of the stage. Results are written as JSON; --compare checks them
+against an earlier file and exits non-zero when a stage got slower than
+--tolerance allows.
+
+    python benchmarks/bench_pipeline.py --rows 1000 10000 100000 --output bench.json
+    python benchmarks/bench_pipeline.py --rows 1000000 --projection svd --clustering minibatch
+    python benchmarks/bench_pipeline.py --images 256 --compare bench.json --output bench_new.json
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ENGINE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_catalog, make_interactions  # noqa: E402
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def timed(stages, name, fn, items, unit):
+    """Run fn() as benchmark stage name, recording time, throughput and peak RSS"""
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    stages[name] = {
+        'seconds': seconds,
+        'items': items,
+        'unit': unit,
+        'throughput': items / seconds if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+    print(f"{name:<26} {seconds:9.3f}s  {items / max(seconds, 1e-9):12.1f} {unit}/s  "
+          f"peak RSS {stages[name]['peak_rss_mb']:8.1f} MB", flush=True)
+    return result
+
+
+def bench_catalog(n_rows, settings):
+    """Time the board pipeline on an n_rows synthetic catalog"""
+    from product_recommender import PinSageHierarchical
+
+    # product_recommender configures logging on import
+    logging.getLogger().setLevel(settings['log_level'])
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_path = os.path.join(tmp_dir, f'catalog.{settings["format"]}')
+        catalog = make_catalog(n_rows)
+        if settings['format'] == 'parquet':
+            catalog.to_parquet(dataset_path, index=False)
+        else:
+            catalog.to_csv(dataset_path, index=False)
+        del catalog
+
+        model = PinSageHierarchical(graph_backend=settings['graph_backend'])
+        df = timed(stages, 'load_ecommerce_dataset',
+                   lambda: model.load_ecommerce_dataset(dataset_path, max_items=None, download_nltk=False),
+                   n_rows, 'rows')
+
+    timed(stages, 'process_ecommerce_data',
+          lambda: model.process_ecommerce_data(df, clustering=settings['clustering'],
+                                               projection=settings['projection']),
+          n_rows, 'rows')
+    n_boards = len(model._hierarchy_adjacency()['boards'])
+    timed(stages, 'generate_embeddings', lambda: model.generate_embeddings(alpha=0.6, max_depth=3),
+          n_boards, 'boards')
+    timed(stages, 'cluster_boards', lambda: model.cluster_boards(), len(model.board_embeddings), 'boards')
+
+    boards = model.board_names
+    queries = [boards[i % len(boards)] for i in range(settings['queries'])]
+    model._ensure_board_index()
+    timed(stages, 'recommend_similar_boards',
+          lambda: [model.recommend_similar_boards(board, top_k=10) for board in queries],
+          len(queries), 'queries')
+
+    n_users = max(100, n_rows // 10)
+    interactions = make_interactions(df['product_id'].to_numpy(), n_users)
+    timed(stages, 'evaluate_recommendations', lambda: model.evaluate_recommendations(interactions),
+          n_users, 'users')
+    return {'rows': n_rows, 'boards': n_boards, 'stages': stages}
+
+
+def write_images(image_dir, n_images, size=(600, 400), random_seed=42):
+    """Random-noise JPEGs in a few category sub-directories, like the img/ folder"""
+    from PIL import Image
+
+    rng = np.random.default_rng(random_seed)
+    image_paths = []
+    for i in range(n_images):
+        category_dir = os.path.join(image_dir, f'category_{i % 4}')
+        os.makedirs(category_dir, exist_ok=True)
+        path = os.path.join(category_dir, f'image_{i}.jpg')
+        pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(path, quality=90)
+        image_paths.append(path)
+    return image_paths
+
+
+def bench_images(n_images, settings):
+    """Time the image embedding pipeline on n_images generated JPEGs"""
+    logging.getLogger().setLevel(settings['log_level'])
+    try:
+        from generate_embeddings import ImageDataset, embed_images, get_transform, load_extractor, scan_images
+        from embedding_store import write_store
+        from image_recognition import ImageRecognitionModel
+    except ImportError as e:
+        print(f"Skipping the image pipeline: {e}")
+        return {'images': n_images, 'skipped': str(e)}
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_images(os.path.join(tmp_dir, 'img'), n_images)
+        image_paths, labels = scan_images(os.path.join(tmp_dir, 'img'))
+        transform = get_transform()
+        model = load_extractor(settings['backend'], image_paths, transform, pretrained=False)
+
+        dataset = ImageDataset(image_paths, transform, fast_decode=settings['fast_decode'])
+        timed(stages, 'image_decode', lambda: [dataset[i] for i in range(len(dataset))], n_images, 'images')
+        embeddings, embedded, _ = timed(
+            stages, 'image_embed',
+            lambda: embed_images(model, image_paths, transform, batch_size=settings['batch_size'],
+                                 num_workers=settings['num_workers'], fast_decode=settings['fast_decode']),
+            n_images, 'images')
+
+        store_path = os.path.join(tmp_dir, 'embeddings')
+        timed(stages, 'image_store_write',
+              lambda: write_store(store_path, embeddings, [image_paths[i] for i in embedded],
+                                  [labels[i] for i in embedded]),
+              len(embedded), 'images')
+        recognition = timed(stages, 'image_index_build', lambda: ImageRecognitionModel(store_path),
+                            len(embedded), 'images')
+        timed(stages, 'image_search',
+              lambda: [recognition.find_similar_to_vector(embeddings[i % len(embeddings)], num_results=5)
+                       for i in range(settings['queries'])],
+              settings['queries'], 'queries')
+    return {'images': n_images, 'stages': stages}
+
+
+def run_isolated(fn, *args):
+    """Run fn(*args) in a fresh process so peak RSS belongs to that run alone"""
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ENGINE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_times(report):
+    """{(run, stage): seconds} of every stage in a report"""
+    times = {}
+    for run in report['catalogs']:
+        for stage, result in run['stages'].items():
+            times[(f"{run['rows']} rows", stage)] = result['seconds']
+    if report.get('images') and 'stages' in report['images']:
+        for stage, result in report['images']['stages'].items():
+            times[(f"{report['images']['images']} images", stage)] = result['seconds']
+    return times
+
+
+def compare(report, baseline, tolerance, min_seconds):
+    """Print per-stage slowdowns against baseline; False if any stage regressed"""
+    current, previous = stage_times(report), stage_times(baseline)
+    ok = True
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for key in sorted(set(current) & set(previous)):
+        ratio = current[key] / previous[key] if previous[key] > 0 else float('inf')
+        regressed = ratio > tolerance and current[key] >= min_seconds
+        ok &= not regressed
+        print(f"{'SLOWER' if regressed else 'ok':>6}  {key[0]:<14} {key[1]:<26} "
+              f"{previous[key]:9.3f}s -> {current[key]:9.3f}s  ({ratio:5.2f}x)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the recommendation engine on synthetic catalogs')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Catalog sizes to benchmark (up to 1000000)')
+    parser.add_argument('--images', type=int, default=64, help='Generated images for the image pipeline (0 skips it)')
+    parser.add_argument('--queries', type=int, default=1000, help='Similarity queries per search stage')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='On-disk format of the catalogs')
+    parser.add_argument('--clustering', choices=['kmeans', 'minibatch'], default='kmeans',
+                        help='Category clustering passed to process_ecommerce_data')
+    parser.add_argument('--projection', choices=['pca', 'svd', 'incremental'], default='pca',
+                        help='Feature projection passed to process_ecommerce_data')
+    parser.add_argument('--graph_backend', default='networkx', help='Graph backend of the model')
+    parser.add_argument('--batch_size', type=int, default=32, help='Images per forward pass')
+    parser.add_argument('--backend', default='eager', help='CNN inference backend (see inference.py)')
+    parser.add_argument('--num_workers', type=int, default=0, help='DataLoader workers for image decoding')
+    parser.add_argument('--fast_decode', action='store_true', help='Decode JPEGs at reduced resolution')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Slowdown ratio above which a stage counts as a regression')
+    parser.add_argument('--min_seconds', type=float, default=0.05,
+                        help='Stages faster than this are too noisy to count as regressions')
+    parser.add_argument('--verbose', action='store_true', help='Show the pipeline\'s own progress logging')
+    args = parser.parse_args()
+
+    settings = {**vars(args), 'log_level': logging.INFO if args.verbose else logging.WARNING}
+
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'catalogs': [],
+        'images': None
+    }
+    for n_rows in args.rows:
+        print(f"\n{n_rows} rows", flush=True)
+        report['catalogs'].append(run_isolated(bench_catalog, n_rows, settings))
+    if args.images:
+        print(f"\n{args.images} images", flush=True)
+        report['images'] = run_isolated(bench_images, args.images, settings)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(0 if compare(report, baseline, args.tolerance, args.min_seconds) else 1)
+
+if __name__ == '__main__':
+    main()
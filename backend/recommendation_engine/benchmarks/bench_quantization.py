@@ -0,0 +1,128 @@
+"""Memory and recall of quantized search (float16, int8, product quantization).
+
+Image search: synthetic 512-d ResNet-like vectors (non-negative, clustered),
+or the vectors of an embedding store with --store, searched through
+ann_index.QuantizedIndex. Recall@k is measured against an exact float32
+scan, both on the raw codes (no re-ranking) and after re-ranking the best
+--rerank * k candidates on exact vectors.
+
+Board search: synthetic board embeddings through BoardIndex with
+quantization, compared with the exact BoardIndex.
+
+    python benchmarks/bench_quantization.py --vectors 100000 --boards 20000
+    python benchmarks/bench_quantization.py --store embeddings --n_subspaces 64 --output quantization.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import QuantizedIndex, normalize_rows, top_k  # noqa: E402
+from board_index import BoardIndex  # noqa: E402
+from embedding_store import open_store  # noqa: E402
+from quantization import CODECS  # noqa: E402
+
+
+def clustered_vectors(n_vectors, dim, n_clusters=200, random_seed=42):
+    """Non-negative clustered vectors, shaped like pooled ResNet features"""
+    rng = np.random.default_rng(random_seed)
+    centers = np.abs(rng.standard_normal((n_clusters, dim))).astype(np.float32)
+    noise = rng.standard_normal((n_vectors, dim)).astype(np.float32)
+    return np.maximum(centers[rng.integers(0, n_clusters, n_vectors)] + 0.5 * noise, 0)
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / max(len(t), 1) for f, t in zip(found, truth)]))
+
+
+def bench_images(vectors, queries, k, rerank, codec_params):
+    exact = normalize_rows(vectors)
+    normalized_queries = normalize_rows(queries)
+    truth = [top_k(exact @ query, k).tolist() for query in normalized_queries]
+    float32_bytes = exact.nbytes
+
+    results = {'float32': {'bytes': float32_bytes, 'ratio': 1.0, 'recall': 1.0}}
+    print(f"{'float32':<8} {float32_bytes / 2**20:9.1f} MB   1.0x  recall@{k} 1.000")
+    for name in CODECS:
+        start = time.perf_counter()
+        index = QuantizedIndex.build(vectors, quantization=name, exact=vectors, rerank=rerank,
+                                     **(codec_params if name == 'pq' else {}))
+        build_seconds = time.perf_counter() - start
+
+        result = {'bytes': index.nbytes, 'ratio': float32_bytes / index.nbytes, 'build_seconds': build_seconds}
+        for label, rerank_factor in (('codes', 0), ('reranked', rerank)):
+            start = time.perf_counter()
+            found = [index.search(query, k, rerank=rerank_factor)[0].tolist() for query in queries]
+            result[f'recall_{label}'] = recall(found, truth)
+            result[f'ms_per_query_{label}'] = 1000 * (time.perf_counter() - start) / len(queries)
+        results[name] = result
+        print(f"{name:<8} {index.nbytes / 2**20:9.1f} MB {result['ratio']:5.1f}x  "
+              f"recall@{k} {result['recall_codes']:.3f} on codes, {result['recall_reranked']:.3f} re-ranked "
+              f"({result['ms_per_query_reranked']:.2f} ms/query, built in {build_seconds:.1f}s)")
+    return results
+
+
+def bench_boards(n_boards, dim, k, rerank, n_queries, codec_params):
+    embeddings = np.random.default_rng(0).standard_normal((n_boards, dim))
+    names = [f'board_{i}' for i in range(n_boards)]
+    exact = BoardIndex(names, embeddings)
+    queries = names[::max(1, n_boards // n_queries)][:n_queries]
+    truth = [[board for board, _ in exact.recommend(query, k)] for query in queries]
+
+    results = {}
+    for name in CODECS:
+        index = BoardIndex(names, embeddings, quantization=name, rerank=rerank,
+                           **(codec_params if name == 'pq' else {}))
+        start = time.perf_counter()
+        found = [[board for board, _ in index.recommend(query, k)] for query in queries]
+        seconds = time.perf_counter() - start
+        results[name] = {'bytes': int(index.codes.nbytes), 'ratio': exact.matrix.nbytes / index.codes.nbytes,
+                         'recall': recall(found, truth), 'ms_per_query': 1000 * seconds / len(queries)}
+        print(f"{name:<8} codes {index.codes.nbytes / 2**20:7.2f} MB vs {exact.matrix.nbytes / 2**20:7.2f} MB  "
+              f"recall@{k} {results[name]['recall']:.3f}  {results[name]['ms_per_query']:.2f} ms/query")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark quantized image and board search')
+    parser.add_argument('--store', default=None, help='Embedding store to use instead of synthetic vectors')
+    parser.add_argument('--vectors', type=int, default=100000, help='Synthetic image vectors')
+    parser.add_argument('--dim', type=int, default=512, help='Dimension of the synthetic image vectors')
+    parser.add_argument('--boards', type=int, default=20000, help='Synthetic boards (0 skips the board benchmark)')
+    parser.add_argument('--board_dim', type=int, default=16, help='Board embedding dimension')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per measurement')
+    parser.add_argument('--k', type=int, default=10, help='Results per query')
+    parser.add_argument('--rerank', type=int, default=4, help='Candidates re-ranked per result')
+    parser.add_argument('--n_subspaces', type=int, default=64, help='PQ subspaces for the image vectors')
+    parser.add_argument('--board_subspaces', type=int, default=8, help='PQ subspaces for the board embeddings')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.store:
+        store = open_store(args.store)
+        vectors = np.asarray(store.vectors[store.live_rows], dtype=np.float32)
+    else:
+        vectors = clustered_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+
+    report = {'settings': vars(args)}
+    print(f"Image search over {len(vectors)} x {vectors.shape[1]} vectors")
+    report['images'] = bench_images(vectors, queries, args.k, args.rerank, {'n_subspaces': args.n_subspaces})
+    if args.boards:
+        print(f"\nBoard search over {args.boards} x {args.board_dim} embeddings")
+        report['boards'] = bench_boards(args.boards, args.board_dim, args.k, args.rerank, args.queries,
+                                        {'n_subspaces': args.board_subspaces})
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
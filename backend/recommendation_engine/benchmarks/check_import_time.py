@@ -0,0 +1,85 @@
+"""Import-time budget for the serving entry points.
+
+Imports each module in a fresh interpreter (best of --repeat runs), checks
+the wall time against its budget and checks that no training, plotting or
+download dependency was loaded along the way. With --model it also times a
+cold start: import board_index, load a saved model and answer one query.
+Exits non-zero when any check fails, so it can gate CI.
+
+    python benchmarks/check_import_time.py
+    python benchmarks/check_import_time.py --model models/pinsage --cold_start_budget 1.0
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TRAINING_MODULES = ('matplotlib', 'seaborn', 'sklearn', 'networkx', 'kagglehub', 'nltk', 'joblib', 'torch')
+
+# module -> (budget in seconds, modules that must not be imported)
+BUDGETS = {
+    'board_index': (0.5, TRAINING_MODULES + ('pandas', 'scipy')),
+    'product_recommender': (1.5, TRAINING_MODULES)
+}
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+COLD_START_SNIPPET = """
+import json, time
+start = time.perf_counter()
+from board_index import BoardIndex
+index = BoardIndex.load({model!r})
+index.recommend(index.names[0], top_k=5)
+print(json.dumps({{'seconds': time.perf_counter() - start, 'boards': len(index)}}))
+"""
+
+
+def run_snippet(code):
+    result = subprocess.run([sys.executable, '-c', code], cwd=ENGINE_DIR, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_import(module, budget, forbidden, repeat):
+    runs = [run_snippet(IMPORT_SNIPPET.format(module=module, forbidden=forbidden)) for _ in range(repeat)]
+    seconds = min(run['seconds'] for run in runs)
+    loaded = sorted(set(name for run in runs for name in run['loaded']))
+    ok = seconds <= budget and not loaded
+    print(f"{'ok' if ok else 'FAIL':>4}  import {module:<20} {seconds:.3f}s (budget {budget:.2f}s)"
+          + (f", loaded {', '.join(loaded)}" if loaded else ''))
+    return ok
+
+
+def check_cold_start(model, budget, repeat):
+    seconds = min(run_snippet(COLD_START_SNIPPET.format(model=os.path.abspath(model)))['seconds']
+                  for _ in range(repeat))
+    ok = seconds <= budget
+    print(f"{'ok' if ok else 'FAIL':>4}  cold start {model:<16} {seconds:.3f}s (budget {budget:.2f}s)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check serving import times against their budgets')
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters per check; the best run counts')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every budget, e.g. for slow CI machines')
+    parser.add_argument('--model', default=None, help='Saved model directory for the cold start check')
+    parser.add_argument('--cold_start_budget', type=float, default=1.0, help='Seconds allowed for the cold start')
+    args = parser.parse_args()
+
+    ok = True
+    for module, (budget, forbidden) in BUDGETS.items():
+        ok &= check_import(module, budget * args.scale, forbidden, args.repeat)
+    if args.model:
+        ok &= check_cold_start(args.model, args.cold_start_budget * args.scale, args.repeat)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
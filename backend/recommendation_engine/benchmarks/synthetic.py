@@ -0,0 +1,49 @@
+"""Synthetic e-commerce catalogs for benchmarks (no network or kagglehub needed)"""
+import numpy as np
+import pandas as pd
+
+BRANDS = ['Nike', 'Adidas', 'Puma', 'Zara', 'H&M', 'Levis', 'Uniqlo', 'Gap']
+CATEGORIES = ['Shoes', 'Shirts', 'Pants', 'Dresses', 'Jackets', 'Accessories']
+SEASONS = ['Summer', 'Winter', 'Fall', 'Spring']
+GENDERS = ['Male', 'Female', 'Unisex']
+LOCATIONS = ['Delhi', 'Mumbai', 'Bangalore', 'Chennai', 'Kolkata']
+WORDS = ['cotton', 'denim', 'leather', 'running', 'casual', 'formal', 'slim', 'classic',
+         'lightweight', 'floral', 'striped', 'waterproof', 'vintage', 'summer', 'winter']
+
+
+def make_catalog(n_rows, random_seed=42, missing_rate=0.05):
+    """Catalog with the columns of the Kaggle dataset process_ecommerce_data expects"""
+    rng = np.random.default_rng(random_seed)
+    words = np.array(WORDS, dtype=object)
+    descriptions = words[rng.integers(0, len(words), n_rows)] + ' ' + words[rng.integers(0, len(words), n_rows)]
+
+    df = pd.DataFrame({
+        'product_id': np.arange(1, n_rows + 1),
+        'Brand': rng.choice(BRANDS, n_rows),
+        'Category': rng.choice(CATEGORIES, n_rows),
+        'Season': rng.choice(SEASONS, n_rows),
+        'Gender': rng.choice(GENDERS, n_rows),
+        'Location': rng.choice(LOCATIONS, n_rows),
+        'Holiday': rng.choice(['Yes', 'No'], n_rows),
+        'Price': rng.gamma(2.0, 40.0, n_rows).round(2),
+        'Rating': rng.uniform(1, 5, n_rows).round(1),
+        'Reviews': rng.integers(0, 5000, n_rows),
+        'Stock': rng.integers(0, 200, n_rows),
+        'Description': descriptions,
+    })
+
+    for col in ['Gender', 'Location', 'Description']:
+        df.loc[rng.random(n_rows) < missing_rate, col] = None
+    return df
+
+
+def make_interactions(product_ids, n_users, per_user=10, random_seed=42):
+    """Interaction rows (user_id, pin_id, rating) with per_user random products per user"""
+    rng = np.random.default_rng(random_seed)
+    product_ids = np.asarray(product_ids)
+    n_rows = n_users * per_user
+    return pd.DataFrame({
+        'user_id': np.repeat(np.arange(1, n_users + 1), per_user),
+        'pin_id': product_ids[rng.integers(0, len(product_ids), n_rows)],
+        'rating': rng.uniform(3, 5, n_rows).round(1),
+    })
@@ -0,0 +1,184 @@
+"""Similarity search over board embeddings, using numpy only.
+
+BoardIndex holds the L2-normalized board embedding matrix that
+PinSageHierarchical.recommend_similar_boards ranks against. It is also the
+serving entry point. BoardIndex.load(path) opens a model directory written by
+PinSageHierarchical.save() and answers queries without importing pandas,
+scipy, sklearn or any plotting code:
+
+    from board_index import BoardIndex
+
+    index = BoardIndex.load('models/pinsage')
+    index.recommend('board_1_subcategory_0_1', top_k=5)
+
+BoardIndex.load(path, quantization='pq') keeps compressed codes (see
+quantization.py) in memory instead of the float matrix, shortlists with them
+and re-ranks the shortlist on the memory-mapped exact embeddings.
+"""
+import numpy as np
+
+from ann_index import l2_normalize
+from model_store import read_model
+from quantization import create_codec
+
+
+def rank_rows(scores, top_k):
+    """Column indices and scores of the top_k entries of each row, best first, ties by column"""
+    top_k = min(top_k, scores.shape[1])
+    if top_k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64), np.zeros((scores.shape[0], 0))
+    if top_k < scores.shape[1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    ranked = np.take_along_axis(candidates, order, axis=1)
+    return ranked, np.take_along_axis(scores, ranked, axis=1)
+
+
+def board_neighbours(board_matrix, board_valid, top_k, chunk_size=4096):
+    """Top-k similar boards (and scores) for every row of a normalized board matrix"""
+    n_boards = len(board_matrix)
+    top_k = min(top_k, max(n_boards - 1, 0))
+    neighbours = np.zeros((n_boards, top_k), dtype=np.int64)
+    scores = np.full((n_boards, top_k), -np.inf)
+
+    for start in range(0, n_boards, chunk_size):
+        stop = min(start + chunk_size, n_boards)
+        block = board_matrix[start:stop] @ board_matrix.T
+        # Same exclusions as BoardIndex.recommend: the board itself and zero-norm boards
+        block[:, ~board_valid] = -np.inf
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        block[~board_valid[start:stop]] = -np.inf
+        neighbours[start:stop], scores[start:stop] = rank_rows(block, top_k)
+    return neighbours, scores
+
+
+def child_positions(names, boards, indptr, indices):
+    """Index positions of each named board's sub-boards, from CSR board->sub-board arrays over boards"""
+    positions = {name: i for i, name in enumerate(names)}
+    rows = {board: i for i, board in enumerate(boards)}
+    children = []
+    for name in names:
+        row = rows.get(name)
+        child_boards = [] if row is None else [
+            positions[boards[child]] for child in indices[indptr[row]:indptr[row + 1]] if boards[child] in positions]
+        children.append(np.array(child_boards, dtype=np.int64))
+    return children
+
+
+class BoardIndex:
+    """Cosine similarity ranking over a fixed set of boards"""
+
+    def __init__(self, names, embeddings, children=None, quantization=None, rerank=4, **codec_params):
+        self.names = list(names)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        matrix = np.asarray(embeddings, dtype=float).reshape(len(self.names), -1)
+        normalized = l2_normalize(matrix)
+        self.valid = normalized.any(axis=1)
+        self.children = children if children is not None else [np.zeros(0, dtype=np.int64)] * len(self.names)
+
+        self.codec = None
+        if quantization is None:
+            self.matrix = normalized
+        else:
+            # Keep the (possibly memory-mapped) exact embeddings for re-ranking instead of a normalized copy
+            self.exact = matrix
+            self.codec = create_codec(quantization, **codec_params).fit(normalized)
+            self.codes = self.codec.encode(normalized)
+            self.rerank = rerank
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, board):
+        return board in self.positions
+
+    @classmethod
+    def load(cls, path, quantization=None, rerank=4, **codec_params):
+        """Open the board embeddings of a model directory written by PinSageHierarchical.save()"""
+        meta, arrays, _ = read_model(path)
+        names = meta['embedded_boards']
+        children = child_positions(names, meta['boards'], arrays['board_children_indptr'],
+                                   arrays['board_children_indices'])
+        return cls(names, arrays['board_embeddings'], children, quantization, rerank, **codec_params)
+
+    def vectors(self, positions=slice(None)):
+        """L2-normalized exact embeddings of the given rows (all rows by default)"""
+        if self.codec is None:
+            return self.matrix[positions]
+        return l2_normalize(np.asarray(self.exact[positions], dtype=float))
+
+    def update(self, names, embeddings):
+        """Replace the embeddings of existing boards in place"""
+        positions = np.array([self.positions[name] for name in names], dtype=np.int64)
+        matrix = np.asarray(embeddings, dtype=float).reshape(len(positions), -1)
+        normalized = l2_normalize(matrix)
+        self.valid[positions] = normalized.any(axis=1)
+        if self.codec is None:
+            self.matrix[positions] = normalized
+            return
+        if not self.exact.flags.writeable:
+            self.exact = np.array(self.exact)
+        self.exact[positions] = matrix
+        self.codes[positions] = self.codec.encode(normalized)
+
+    def top_similar(self, position, scores, top_k=5, exclude_children=False):
+        """Rank one row of board similarities, skipping the query and invalid boards"""
+        scores = np.where(self.valid, scores, -np.inf)
+        scores[position] = -np.inf
+        if exclude_children and len(self.children[position]):
+            scores[self.children[position]] = -np.inf
+
+        n_candidates = min(top_k, int(np.isfinite(scores).sum()))
+        if n_candidates <= 0:
+            return []
+        if n_candidates < len(scores):
+            candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        else:
+            candidates = np.arange(len(scores))
+        # Ties keep board order, like a stable sort
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))][:n_candidates]
+        return [(self.names[i], scores[i]) for i in candidates]
+
+    def _quantized_scores(self, position, top_k, exclude_children):
+        """Exact scores for the rerank * top_k best boards by code, -inf everywhere else"""
+        query = self.vectors(position)
+        approx = np.where(self.valid, self.codec.scores(query, self.codes), -np.inf)
+        approx[position] = -np.inf
+        if exclude_children and len(self.children[position]):
+            approx[self.children[position]] = -np.inf
+
+        n_candidates = min(top_k * self.rerank, int(np.isfinite(approx).sum()))
+        scores = np.full(len(self.names), -np.inf)
+        if n_candidates > 0:
+            candidates = np.sort(np.argpartition(-approx, n_candidates - 1)[:n_candidates])
+            scores[candidates] = self.vectors(candidates) @ query
+        return scores
+
+    def recommend(self, query_board, top_k=5, exclude_children=False):
+        """(board, similarity) pairs of the boards most similar to query_board"""
+        if query_board not in self.positions:
+            raise ValueError(f"Board '{query_board}' not found in embeddings")
+
+        position = self.positions[query_board]
+        if not self.valid[position]:
+            return []
+        if self.codec is not None:
+            return self.top_similar(position, self._quantized_scores(position, top_k, exclude_children), top_k,
+                                    exclude_children)
+        return self.top_similar(position, self.matrix @ self.matrix[position], top_k, exclude_children)
+
+    def recommend_many(self, query_boards, top_k=5, exclude_children=False):
+        """recommend() for many query boards with a single matrix product"""
+        missing = [board for board in query_boards if board not in self.positions]
+        if missing:
+            raise ValueError(f"Board '{missing[0]}' not found in embeddings")
+        if self.codec is not None:
+            return [self.recommend(board, top_k, exclude_children) for board in query_boards]
+
+        positions = np.array([self.positions[board] for board in query_boards], dtype=np.int64)
+        scores = self.matrix[positions] @ self.matrix.T
+        return [self.top_similar(position, row, top_k, exclude_children) if self.valid[position] else []
+                for position, row in zip(positions, scores)]
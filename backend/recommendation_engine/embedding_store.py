@@ -0,0 +1,318 @@
+"""Memory-mapped binary storage for image embeddings.
+
+A store is a directory holding:
+
+    meta.json         format version, dtype, dimension, row count and label names
+    vectors.bin       row-major embedding matrix (float32 or float16)
+    label_ids.bin     int32 index into the label names, one per row
+    paths.bin         UTF-8 image paths, concatenated
+    path_offsets.bin  int64 byte offsets into paths.bin (count + 1 entries)
+    manifest.json     optional, path -> [mtime, size, sha1, row] for incremental refreshes
+
+Every array is opened with np.memmap, so opening a store only reads meta.json
+and the pages of the matrix are shared by every process that maps it.
+
+Rows are only ever appended. Rows of deleted or changed images are listed as
+tombstones in meta.json until the store is compacted.
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+STORE_VERSION = 1
+SUPPORTED_DTYPES = ('float32', 'float16')
+
+META_FILE = 'meta.json'
+VECTORS_FILE = 'vectors.bin'
+LABEL_IDS_FILE = 'label_ids.bin'
+PATHS_FILE = 'paths.bin'
+PATH_OFFSETS_FILE = 'path_offsets.bin'
+MANIFEST_FILE = 'manifest.json'
+
+
+def _memmap(path, dtype, shape):
+    # np.memmap refuses zero-length files, so empty stores get plain arrays
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+class EmbeddingStore:
+    """Read-only view of an embedding store directory"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(os.path.join(self.path, META_FILE)) as f:
+            self.meta = json.load(f)
+
+        if self.meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported embedding store version: {self.meta.get('version')}")
+
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.dim = self.meta['dim']
+        self.count = self.meta['count']
+        self.label_names = self.meta['labels']
+        self.tombstones = np.asarray(self.meta.get('tombstones', []), dtype=np.int64)
+
+        self.vectors = _memmap(os.path.join(self.path, VECTORS_FILE), self.dtype, (self.count, self.dim))
+        self.label_ids = _memmap(os.path.join(self.path, LABEL_IDS_FILE), np.int32, (self.count,))
+        self._path_offsets = _memmap(os.path.join(self.path, PATH_OFFSETS_FILE), np.int64, (self.count + 1,))
+        self._paths = None
+
+    def __len__(self):
+        return self.count
+
+    def _path_blob(self):
+        if self._paths is None:
+            size = int(self._path_offsets[-1]) if self.count else 0
+            self._paths = _memmap(os.path.join(self.path, PATHS_FILE), np.uint8, (size,))
+        return self._paths
+
+    def image_path(self, row):
+        """Image path of a single row, decoded without loading the others"""
+        start, end = self._path_offsets[row], self._path_offsets[row + 1]
+        return self._path_blob()[start:end].tobytes().decode('utf-8')
+
+    def label(self, row):
+        return self.label_names[self.label_ids[row]]
+
+    @property
+    def image_paths(self):
+        """All image paths, decoded in one pass"""
+        if not self.count:
+            return []
+        blob = self._path_blob().tobytes()
+        offsets = self._path_offsets.tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.count)]
+
+    @property
+    def labels(self):
+        names = self.label_names
+        return [names[i] for i in self.label_ids.tolist()]
+
+    @property
+    def live_mask(self):
+        """Boolean mask of the rows that have not been tombstoned"""
+        mask = np.ones(self.count, dtype=bool)
+        mask[self.tombstones] = False
+        return mask
+
+    @property
+    def live_rows(self):
+        return np.flatnonzero(self.live_mask)
+
+
+def open_store(path):
+    """Open an embedding store for reading"""
+    return EmbeddingStore(path)
+
+
+def _encode_paths(image_paths):
+    encoded = [p.encode('utf-8') for p in image_paths]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(p) for p in encoded], out=offsets[1:])
+    return b''.join(encoded), offsets
+
+
+def _encode_labels(labels, label_names=None):
+    label_names = list(label_names or [])
+    index = {name: i for i, name in enumerate(label_names)}
+    label_ids = np.empty(len(labels), dtype=np.int32)
+    for i, label in enumerate(labels):
+        if label not in index:
+            index[label] = len(label_names)
+            label_names.append(label)
+        label_ids[i] = index[label]
+    return label_ids, label_names
+
+
+@contextlib.contextmanager
+def atomic_directory(path):
+    """Yield an empty temporary directory that replaces the directory at path on success
+
+    Readers never see a half-written directory: the old one is moved aside,
+    the new one renamed into place and only then the old one deleted. If
+    the body raises, path is left untouched.
+    """
+    path = str(path)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    yield tmp_path
+
+    old_path = path + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _write_meta(path, meta):
+    _write_json(os.path.join(path, META_FILE), meta)
+
+
+def read_manifest(path):
+    """Read the incremental refresh manifest of a store, empty if there is none"""
+    manifest_path = os.path.join(str(path), MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_manifest(path, manifest):
+    _write_json(os.path.join(str(path), MANIFEST_FILE), manifest)
+
+
+def write_store(path, embeddings, image_paths, labels, dtype='float32', manifest=None):
+    """Write a complete store, replacing any existing store at path"""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+
+    embeddings = np.asarray(embeddings)
+    if embeddings.ndim != 2:
+        raise ValueError(f"Embeddings must be a 2-D matrix, got shape {embeddings.shape}")
+    if not len(embeddings) == len(image_paths) == len(labels):
+        raise ValueError("embeddings, image_paths and labels must have the same length")
+
+    path = str(path)
+    with atomic_directory(path) as tmp_path:
+        np.ascontiguousarray(embeddings, dtype=dtype).tofile(os.path.join(tmp_path, VECTORS_FILE))
+
+        label_ids, label_names = _encode_labels(labels)
+        label_ids.tofile(os.path.join(tmp_path, LABEL_IDS_FILE))
+
+        blob, offsets = _encode_paths(image_paths)
+        with open(os.path.join(tmp_path, PATHS_FILE), 'wb') as f:
+            f.write(blob)
+        offsets.tofile(os.path.join(tmp_path, PATH_OFFSETS_FILE))
+
+        _write_meta(tmp_path, {
+            'version': STORE_VERSION,
+            'dtype': dtype,
+            'dim': int(embeddings.shape[1]),
+            'count': len(embeddings),
+            'labels': label_names,
+            'tombstones': []
+        })
+        if manifest is not None:
+            write_manifest(tmp_path, manifest)
+
+    return open_store(path)
+
+
+def append_rows(path, embeddings, image_paths, labels):
+    """Append rows to an existing store and return the index of the first new row"""
+    store = open_store(path)
+    embeddings = np.asarray(embeddings)
+    if len(embeddings) and embeddings.shape[1:] != (store.dim,):
+        raise ValueError(f"Expected embeddings of dimension {store.dim}, got shape {embeddings.shape}")
+    if not len(embeddings) == len(image_paths) == len(labels):
+        raise ValueError("embeddings, image_paths and labels must have the same length")
+
+    path = str(path)
+    first_row = store.count
+    path_end = int(store._path_offsets[-1]) if store.count else 0
+    expected_sizes = {
+        VECTORS_FILE: store.count * store.dim * store.dtype.itemsize,
+        LABEL_IDS_FILE: store.count * 4,
+        PATHS_FILE: path_end,
+        PATH_OFFSETS_FILE: (store.count + 1) * 8
+    }
+    # Drop anything left behind by an append that crashed before meta.json was updated
+    for name, size in expected_sizes.items():
+        os.truncate(os.path.join(path, name), size)
+
+    label_ids, label_names = _encode_labels(labels, store.label_names)
+    blob, offsets = _encode_paths(image_paths)
+    meta = store.meta
+
+    with open(os.path.join(path, VECTORS_FILE), 'ab') as f:
+        f.write(np.ascontiguousarray(embeddings, dtype=store.dtype).tobytes())
+    with open(os.path.join(path, LABEL_IDS_FILE), 'ab') as f:
+        f.write(label_ids.tobytes())
+    with open(os.path.join(path, PATHS_FILE), 'ab') as f:
+        f.write(blob)
+    with open(os.path.join(path, PATH_OFFSETS_FILE), 'ab') as f:
+        f.write((offsets[1:] + path_end).tobytes())
+
+    # meta.json is written last, so readers only ever see complete rows
+    meta['count'] = first_row + len(embeddings)
+    meta['labels'] = label_names
+    _write_meta(path, meta)
+    return first_row
+
+
+def tombstone_rows(path, rows):
+    """Mark rows as deleted without rewriting the store"""
+    store = open_store(path)
+    rows = np.asarray(list(rows), dtype=np.int64)
+    if len(rows) and (rows.min() < 0 or rows.max() >= store.count):
+        raise IndexError(f"Tombstoned rows must be in [0, {store.count})")
+    meta = store.meta
+    meta['tombstones'] = np.union1d(store.tombstones, rows).tolist()
+    _write_meta(str(path), meta)
+
+
+def compact_store(path):
+    """Rewrite the store without its tombstoned rows.
+
+    Returns an array mapping old row indices to new ones (-1 for dropped rows)
+    and remaps the rows referenced by the manifest.
+    """
+    store = open_store(path)
+    live_rows = store.live_rows
+    row_map = np.full(store.count, -1, dtype=np.int64)
+    row_map[live_rows] = np.arange(len(live_rows))
+
+    manifest = read_manifest(path)
+    for entry in manifest.values():
+        entry[3] = int(row_map[entry[3]])
+    manifest = {image_path: entry for image_path, entry in manifest.items() if entry[3] >= 0}
+
+    image_paths = store.image_paths
+    labels = store.labels
+    write_store(path, np.asarray(store.vectors[live_rows]),
+                [image_paths[i] for i in live_rows], [labels[i] for i in live_rows],
+                dtype=store.meta['dtype'], manifest=manifest)
+    return row_map
+
+
+def convert_json(json_path, store_path, dtype='float32'):
+    """Convert a legacy embeddings.json file into an embedding store"""
+    with open(json_path) as f:
+        data = json.load(f)
+
+    embeddings = np.asarray(data['embeddings'], dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings.reshape(0, 512)
+    return write_store(store_path, embeddings, data['image_paths'], data['labels'], dtype=dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert embeddings.json into a memory-mapped embedding store')
+    parser.add_argument('json_path', help='Path to the legacy embeddings.json file')
+    parser.add_argument('store_path', help='Directory to write the embedding store to')
+    parser.add_argument('--dtype', choices=SUPPORTED_DTYPES, default='float32', help='Storage dtype for the vectors')
+    args = parser.parse_args()
+
+    store = convert_json(args.json_path, args.store_path, dtype=args.dtype)
+    print(f"Converted {len(store)} embeddings to {args.store_path}")
+
+if __name__ == '__main__':
+    main()
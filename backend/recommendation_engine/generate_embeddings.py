@@ -1,29 +1,323 @@
 import torch
 import torch.nn as nn
+from torch.utils.data import Dataset, DataLoader
 from torchvision import models, transforms
-from PIL import Image
 import numpy as np
-import json
+import argparse
+import hashlib
+import logging
 import os
+import time
 from tqdm import tqdm
+from embedding_store import (SUPPORTED_DTYPES, META_FILE, append_rows, compact_store, open_store,
+                             read_manifest, tombstone_rows, write_manifest, write_store)
+from image_preprocessing import CropCache, get_crop_transform, get_tensor_transform, open_image
+from inference import BACKENDS, DEFAULT_PARITY_THRESHOLD, check_parity, load_backend, optimize_model, save_backend
 
-def main():
-    # Load pre-trained model
-    model = models.resnet18(pretrained=True)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_model(pretrained=True):
+    """Load pre-trained ResNet-18 without its classification layer
+
+    pretrained=False skips the weight download (randomly initialised
+    weights cost the same to run, which is all benchmarks need).
+    """
+    model = models.resnet18(pretrained=pretrained)
     model = nn.Sequential(*list(model.children())[:-1])
     model.eval()
+    return model
+
+
+def load_extractor(backend='eager', image_paths=(), transform=None, sample_size=32,
+                   parity_threshold=DEFAULT_PARITY_THRESHOLD, pretrained=True, cache_dir=None):
+    """Feature extractor for an inference backend, checked against the eager model
+
+    Up to 2 * sample_size of image_paths are decoded: the first half
+    calibrates the int8 backend and the second half is used for the parity
+    check (both halves are the same images when there are few). With
+    cache_dir the checked backend is saved there, and later calls load it
+    without decoding images or running the check again.
+    """
+    if backend == 'eager':
+        return load_model(pretrained)
+    if cache_dir:
+        cached = load_backend(cache_dir, backend, parity_threshold, pretrained)
+        if cached is not None:
+            logging.info(f"Using the {backend} backend saved in {cache_dir}")
+            return cached
+
+    model = load_model(pretrained)
+
+    images = sample_images(image_paths, transform or get_transform(), 2 * sample_size)
+    if images is None:
+        calibration = None
+        images = torch.randn(4, 3, 224, 224)
+    else:
+        calibration = images[:sample_size]
+        images = images[sample_size:] if len(images) > sample_size else images
+    optimized = optimize_model(model, backend, calibration)
+    similarity = check_parity(optimized, model, images, parity_threshold)
+    logging.info(f"Using the {backend} backend (min cosine similarity to eager {similarity:.4f} "
+                 f"on {len(images)} images)")
+    if cache_dir:
+        save_backend(optimized, backend, cache_dir, images[:1], similarity, pretrained)
+    return optimized
+
+
+def sample_images(image_paths, transform, size):
+    """Evenly spaced, decoded and transformed images as one batch (None if none could be read)"""
+    image_paths = list(image_paths)
+    positions = np.unique(np.linspace(0, len(image_paths) - 1, min(size, len(image_paths))).astype(int)) \
+        if image_paths else []
+    images = []
+    for position in positions:
+        try:
+            images.append(transform(open_image(image_paths[position])))
+        except Exception:
+            continue
+    return torch.stack(images) if images else None
+
+
+def get_transform():
+    """Image preprocessing used for both the catalog and query images"""
+    return transforms.Compose([get_crop_transform(), get_tensor_transform()])
+
+
+def scan_images(data_dir):
+    """Walk the image directory and return image paths with their category labels"""
+    image_paths = []
+    labels = []
+    for root, _, files in os.walk(data_dir):
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.append(os.path.join(root, file))
+                labels.append(os.path.basename(root).replace('_', ' '))
+    return image_paths, labels
+
+
+class ImageDataset(Dataset):
+    """Decodes and transforms images so the work can run in DataLoader workers
+
+    With a crop_cache the cached uint8 crops only go through the tensor half
+    of get_transform(), so transform must be get_transform() in that case.
+    """
+
+    def __init__(self, image_paths, transform, fast_decode=False, crop_cache=None):
+        self.image_paths = image_paths
+        self.transform = transform
+        self.fast_decode = fast_decode
+        self.crop_cache = crop_cache
+        self.tensor_transform = get_tensor_transform()
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        image_path = self.image_paths[idx]
+        try:
+            if self.crop_cache is not None:
+                return self.tensor_transform(self.crop_cache.load(image_path)), idx
+            image = open_image(image_path, self.fast_decode)
+            return self.transform(image), idx
+        except Exception as e:
+            print(f"\nError processing {image_path}: {e}")
+            return None, idx
+
+
+def collate_images(batch):
+    """Stack the decoded images of a batch and keep track of the ones that failed"""
+    images = [image for image, _ in batch if image is not None]
+    indices = [idx for image, idx in batch if image is not None]
+    failed = [idx for image, idx in batch if image is None]
+    return (torch.stack(images) if images else None), indices, failed
+
+
+def embed_images(model, image_paths, transform, batch_size=32, num_workers=0, num_threads=None,
+                 fast_decode=False, crop_cache=None):
+    """Embed images in batches.
+
+    fast_decode and crop_cache are described in image_preprocessing.py.
+
+    Returns a float32 array of embeddings, the indices into image_paths that
+    were embedded (in order) and the indices that failed to load.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    dataset = ImageDataset(image_paths, transform, fast_decode, crop_cache)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False,
+                        num_workers=num_workers, collate_fn=collate_images)
+
+    chunks = []
+    embedded = []
+    failed = []
+    start = time.perf_counter()
+    with torch.inference_mode(), tqdm(total=len(dataset), unit='img') as progress:
+        for images, indices, failed_indices in loader:
+            if images is not None:
+                output = model(images)
+                chunks.append(output.flatten(1).numpy())
+                embedded.extend(indices)
+            failed.extend(failed_indices)
+            progress.update(len(indices) + len(failed_indices))
+    elapsed = time.perf_counter() - start
+
+    if elapsed > 0:
+        print(f"Embedded {len(embedded)} images in {elapsed:.1f}s "
+              f"({len(embedded) / elapsed:.1f} images/sec)")
+
+    if chunks:
+        embeddings = np.concatenate(chunks).astype(np.float32, copy=False)
+    else:
+        embeddings = np.zeros((0, 512), dtype=np.float32)
+    return embeddings, embedded, failed
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """Content hash used to tell whether an image really changed"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_entry(path, row, digest=None):
+    """Manifest record [mtime, size, sha1, row] for an embedded image"""
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size, digest or file_sha1(path), row]
 
-    # Image preprocessing
-    transform = transforms.Compose([
-        transforms.Resize(224),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                          std=[0.229, 0.224, 0.225])
-    ])
+
+def report_failures(image_paths, failed):
+    if failed:
+        print(f"\nFailed to process {len(failed)} images:")
+        for idx in failed:
+            print(f"  - {image_paths[idx]}")
+
+
+def open_crop_cache(args):
+    return CropCache(args.crop_cache, fast_decode=args.fast_decode) if args.crop_cache else None
+
+
+def build_store(args, image_paths, labels):
+    """Embed every image and write a fresh store with its manifest"""
+    transform = get_transform()
+    model = load_extractor(args.backend, image_paths, transform, parity_threshold=args.parity_threshold)
+
+    print("Generating embeddings...")
+    embeddings, embedded, failed = embed_images(
+        model, image_paths, transform, batch_size=args.batch_size,
+        num_workers=args.num_workers, num_threads=args.num_threads,
+        fast_decode=args.fast_decode, crop_cache=open_crop_cache(args))
+    report_failures(image_paths, failed)
+
+    # Remove the failed images from our dataset
+    image_paths = [image_paths[idx] for idx in embedded]
+    labels = [labels[idx] for idx in embedded]
+    manifest = {path: manifest_entry(path, row) for row, path in enumerate(image_paths)}
+
+    # Save embeddings to the memory-mapped store
+    print("\nSaving embeddings...")
+    write_store(args.output, embeddings, image_paths, labels, dtype=args.dtype, manifest=manifest)
+
+    print(f"Successfully saved embeddings for {len(embeddings)} images to {args.output}")
+
+
+def refresh_store(args, image_paths, labels):
+    """Embed only new or changed images and tombstone the rows of removed ones"""
+    manifest = read_manifest(args.output)
+    new_manifest = {}
+    stale_rows = []
+    pending = []
+
+    print("Checking for new and changed images...")
+    for idx, path in enumerate(image_paths):
+        entry = manifest.get(path)
+        stat = os.stat(path)
+        if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+            new_manifest[path] = entry
+            continue
+
+        digest = file_sha1(path)
+        if entry and entry[2] == digest:
+            # Touched but not modified, keep the existing row
+            new_manifest[path] = [stat.st_mtime, stat.st_size, digest, entry[3]]
+            continue
+
+        if entry:
+            stale_rows.append(entry[3])
+        pending.append((idx, digest))
+
+    current = set(image_paths)
+    removed = [path for path in manifest if path not in current]
+    stale_rows.extend(manifest[path][3] for path in removed)
+    print(f"{len(pending)} new or changed images, {len(removed)} removed")
+
+    if pending:
+        pending_paths = [image_paths[idx] for idx, _ in pending]
+        transform = get_transform()
+        model = load_extractor(args.backend, pending_paths, transform, parity_threshold=args.parity_threshold)
+
+        print("Generating embeddings...")
+        embeddings, embedded, failed = embed_images(
+            model, pending_paths, transform, batch_size=args.batch_size,
+            num_workers=args.num_workers, num_threads=args.num_threads,
+            fast_decode=args.fast_decode, crop_cache=open_crop_cache(args))
+        report_failures(pending_paths, failed)
+
+        first_row = append_rows(args.output, embeddings, [pending_paths[i] for i in embedded],
+                                [labels[pending[i][0]] for i in embedded])
+        for offset, i in enumerate(embedded):
+            new_manifest[pending_paths[i]] = manifest_entry(pending_paths[i], first_row + offset, pending[i][1])
+
+    # Rows not referenced by the manifest (e.g. left by an interrupted refresh) are dead too
+    store = open_store(args.output)
+    referenced = {entry[3] for entry in new_manifest.values()}
+    stale_rows.extend(row for row in store.live_rows.tolist() if row not in referenced)
+    if stale_rows:
+        tombstone_rows(args.output, stale_rows)
+    write_manifest(args.output, new_manifest)
+
+    store = open_store(args.output)
+    print(f"Store now has {len(store.live_rows)} live rows and {len(store.tombstones)} tombstones")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate ResNet-18 embeddings for the image catalog')
+    parser.add_argument('--batch_size', type=int, default=32,
+                        help='Images per forward pass (1 reproduces the per-image path)')
+    parser.add_argument('--num_workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='DataLoader worker processes used to decode images (0 decodes on the main thread)')
+    parser.add_argument('--num_threads', type=int, default=None,
+                        help='Threads used by torch for the forward pass (defaults to torch\'s choice)')
+    parser.add_argument('--backend', choices=BACKENDS, default='eager',
+                        help='Inference backend for the forward pass (checked against eager before use)')
+    parser.add_argument('--parity_threshold', type=float, default=DEFAULT_PARITY_THRESHOLD,
+                        help='Lowest cosine similarity to the eager embeddings a backend may have')
+    parser.add_argument('--fast_decode', action='store_true',
+                        help='Decode JPEGs at reduced resolution (DCT-domain downscaling) before the 224px resize')
+    parser.add_argument('--crop_cache', default=None,
+                        help='Directory caching the 224x224 uint8 crops, so re-embedding skips decoding')
+    parser.add_argument('--data_dir', default=os.path.join(os.path.dirname(__file__), 'img'),
+                        help='Directory of category sub-directories holding the images')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(__file__), 'embeddings'),
+                        help='Directory of the embedding store to write')
+    parser.add_argument('--dtype', choices=SUPPORTED_DTYPES, default='float32',
+                        help='Storage dtype of the embedding matrix')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only embed images that are new or changed since the last run')
+    parser.add_argument('--compact', action='store_true',
+                        help='Drop tombstoned rows from the store after embedding')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
 
     # Load image paths and labels from the dataset
-    data_dir = os.path.join(os.path.dirname(__file__), 'img')
+    data_dir = args.data_dir
     if not os.path.exists(data_dir):
         print(f"Creating image directory: {data_dir}")
         os.makedirs(data_dir)
@@ -32,16 +326,9 @@ def main():
         print("Example: img/jeans/image1.jpg, img/dresses/image2.jpg")
         return
 
-    image_paths = []
-    labels = []
-
     # Walk through the image directory
     print("Scanning image directory...")
-    for root, _, files in os.walk(data_dir):
-        for file in files:
-            if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                image_paths.append(os.path.join(root, file))
-                labels.append(os.path.basename(root).replace('_', ' '))
+    image_paths, labels = scan_images(data_dir)
 
     if not image_paths:
         print("No images found in the 'img' directory")
@@ -50,49 +337,15 @@ def main():
 
     print(f"Found {len(image_paths)} images in {len(set(labels))} categories")
 
-    # Generate embeddings
-    embeddings = []
-    failed_images = []
-    print("Generating embeddings...")
-    for image_path in tqdm(image_paths):
-        try:
-            # Load and preprocess image
-            image = Image.open(image_path).convert('RGB')
-            image = transform(image)
-            image = image.unsqueeze(0)  # Add batch dimension
-
-            # Get embedding
-            with torch.no_grad():
-                embedding = model(image)
-            embedding = embedding.squeeze().numpy()
-            embeddings.append(embedding.tolist())  # Convert to list for JSON serialization
-        except Exception as e:
-            print(f"\nError processing {image_path}: {e}")
-            failed_images.append(image_path)
-            # Remove the failed image from our dataset
-            idx = image_paths.index(image_path)
-            image_paths.pop(idx)
-            labels.pop(idx)
-            continue
-
-    if failed_images:
-        print(f"\nFailed to process {len(failed_images)} images:")
-        for path in failed_images:
-            print(f"  - {path}")
-
-    # Save embeddings to JSON
-    print("\nSaving embeddings...")
-    data = {
-        'embeddings': embeddings,
-        'image_paths': image_paths,
-        'labels': labels
-    }
-
-    output_path = os.path.join(os.path.dirname(__file__), 'embeddings.json')
-    with open(output_path, 'w') as f:
-        json.dump(data, f)
+    if args.incremental and os.path.exists(os.path.join(args.output, META_FILE)):
+        refresh_store(args, image_paths, labels)
+    else:
+        build_store(args, image_paths, labels)
 
-    print(f"Successfully saved embeddings for {len(embeddings)} images to {output_path}")
+    if args.compact:
+        print("Compacting embedding store...")
+        compact_store(args.output)
+        print(f"Compacted store has {len(open_store(args.output))} rows")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,378 @@
+"""Graph backends for PinSageHierarchical.
+
+'networkx' is a plain networkx.DiGraph. 'compact' is CompactGraph: it keeps
+the subset of the DiGraph API the model uses, but stores nodes as integer ids
+with array-backed type and level columns, edges as CSR arrays in both
+directions and every pin feature vector in one contiguous matrix. At catalog
+scale this avoids networkx's per-node and per-edge dicts.
+"""
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+NODE_TYPES = ('pin', 'board')
+GRAPH_BACKENDS = ('networkx', 'compact')
+
+
+def _to_numpy(values, dtype):
+    """Copy an array.array into numpy (a view would pin the array and block appends)"""
+    return np.frombuffer(values, dtype=dtype).copy() if len(values) else np.zeros(0, dtype=dtype)
+
+
+def _to_array(typecode, values):
+    result = array(typecode)
+    result.frombytes(np.ascontiguousarray(values).tobytes())
+    return result
+
+
+def create_graph(backend='networkx'):
+    """Create an empty graph for the given backend name"""
+    if backend == 'networkx':
+        import networkx as nx
+        return nx.DiGraph()
+    if backend == 'compact':
+        return CompactGraph()
+    raise ValueError(f"Unknown graph backend '{backend}', expected one of {GRAPH_BACKENDS}")
+
+
+class _NodeView:
+    """Mimics networkx's graph.nodes: iterable, callable with data=..., indexable by node"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False, default=None):
+        graph = self._graph
+        if data is False:
+            return iter(graph._names)
+        if data is True:
+            return ((name, graph._attributes(i)) for i, name in enumerate(graph._names))
+        return zip(graph._names, graph._column(data, default))
+
+    def __iter__(self):
+        return iter(self._graph._names)
+
+    def __len__(self):
+        return len(self._graph._names)
+
+    def __contains__(self, node):
+        return node in self._graph._ids
+
+    def __getitem__(self, node):
+        return self._graph._attributes(self._graph._ids[node])
+
+
+class CompactGraph:
+    """Array-backed directed graph exposing the networkx.DiGraph calls PinSageHierarchical makes"""
+
+    def __init__(self):
+        self._names = []
+        self._ids = {}
+        self._types = array('b')
+        self._levels = array('h')
+        self._board_names = {}
+        self._feature_rows = array('q')
+        self._features = None
+        self._n_features = 0
+        self._extra = {}
+
+        self._src = array('q')
+        self._dst = array('q')
+        self._relation_codes = array('b')
+        self._relations = []
+        self._csr = None
+
+    # Nodes
+
+    def _node_id(self, node):
+        node_id = self._ids.get(node)
+        if node_id is None:
+            node_id = len(self._names)
+            self._ids[node] = node_id
+            self._names.append(node)
+            self._types.append(-1)
+            self._levels.append(-1)
+            self._feature_rows.append(-1)
+            self._csr = None
+        return node_id
+
+    def _set_features(self, node_id, features):
+        features = np.asarray(features, dtype=float)
+        if self._features is None:
+            self._features = np.zeros((1024, len(features)))
+        row = self._feature_rows[node_id]
+        if row < 0:
+            if self._n_features == len(self._features):
+                # Grow geometrically so appends stay amortized O(1)
+                grown = np.zeros((2 * len(self._features), self._features.shape[1]))
+                grown[:self._n_features] = self._features[:self._n_features]
+                self._features = grown
+            row = self._n_features
+            self._n_features += 1
+            self._feature_rows[node_id] = row
+        self._features[row] = features
+
+    def add_node(self, node, **attrs):
+        node_id = self._node_id(node)
+        for key, value in attrs.items():
+            if key == 'type' and value in NODE_TYPES:
+                self._types[node_id] = NODE_TYPES.index(value)
+            elif key == 'level' and value is not None:
+                self._levels[node_id] = value
+            elif key == 'name':
+                self._board_names[node_id] = value
+            elif key == 'features':
+                self._set_features(node_id, value)
+            else:
+                self._extra.setdefault(node_id, {})[key] = value
+
+    def add_nodes_from(self, nodes, **attrs):
+        for node in nodes:
+            if isinstance(node, tuple):
+                node, node_attrs = node
+                self.add_node(node, **attrs, **node_attrs)
+            else:
+                self.add_node(node, **attrs)
+
+    def remove_nodes_from(self, nodes):
+        """Remove nodes and their edges, renumbering the remaining node ids in order"""
+        removed = [self._ids[node] for node in nodes if node in self._ids]
+        if not removed:
+            return
+        csr = self._ensure_csr()
+        keep = np.ones(len(self._names), dtype=bool)
+        keep[removed] = False
+        new_ids = np.cumsum(keep) - 1
+
+        kept_edges = keep[csr['edge_src']] & keep[csr['edge_dst']]
+        self._src = _to_array('q', new_ids[csr['edge_src'][kept_edges]])
+        self._dst = _to_array('q', new_ids[csr['edge_dst'][kept_edges]])
+        self._relation_codes = _to_array('b', csr['edge_relation'][kept_edges])
+
+        # Drop the removed nodes' feature rows so the matrix doesn't keep growing
+        feature_rows = _to_numpy(self._feature_rows, np.int64)[keep]
+        has_features = feature_rows >= 0
+        if self._features is not None:
+            self._features = self._features[feature_rows[has_features]]
+            self._n_features = len(self._features)
+        feature_rows[has_features] = np.arange(has_features.sum())
+        self._feature_rows = _to_array('q', feature_rows)
+
+        self._types = _to_array('b', self.type_codes[keep])
+        self._levels = _to_array('h', self.levels[keep])
+        self._board_names = {int(new_ids[i]): name for i, name in self._board_names.items() if keep[i]}
+        self._extra = {int(new_ids[i]): attrs for i, attrs in self._extra.items() if keep[i]}
+        self._names = [name for name, kept in zip(self._names, keep) if kept]
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._csr = None
+
+    def _attributes(self, node_id):
+        attrs = {}
+        if self._types[node_id] >= 0:
+            attrs['type'] = NODE_TYPES[self._types[node_id]]
+        if self._levels[node_id] >= 0:
+            attrs['level'] = self._levels[node_id]
+        if node_id in self._board_names:
+            attrs['name'] = self._board_names[node_id]
+        if self._feature_rows[node_id] >= 0:
+            attrs['features'] = self._features[self._feature_rows[node_id]]
+        attrs.update(self._extra.get(node_id, {}))
+        return attrs
+
+    def _column(self, key, default=None):
+        n = len(self._names)
+        if key == 'type':
+            # Index -1 (untyped) picks the trailing default
+            lookup = np.array(NODE_TYPES + (default,), dtype=object)
+            return lookup[self.type_codes].tolist()
+        if key == 'level':
+            levels = self.levels
+            return [int(level) if level >= 0 else default for level in levels]
+        if key == 'name':
+            return [self._board_names.get(i, default) for i in range(n)]
+        if key == 'features':
+            return [self._features[row] if row >= 0 else default for row in self._feature_rows]
+        return [self._extra.get(i, {}).get(key, default) for i in range(n)]
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    @property
+    def type_codes(self):
+        """int8 node type per node id (0 pin, 1 board, -1 untyped)"""
+        return _to_numpy(self._types, np.int8)
+
+    @property
+    def levels(self):
+        """int16 board level per node id (-1 when unset)"""
+        return _to_numpy(self._levels, np.int16)
+
+    def node_ids(self, node_type):
+        """Ids of every node of a type, in insertion order"""
+        return np.flatnonzero(self.type_codes == NODE_TYPES.index(node_type))
+
+    def feature_matrix(self, node_ids):
+        """Feature rows of the given nodes as one (n, dim) array"""
+        rows = _to_numpy(self._feature_rows, np.int64)[node_ids]
+        if self._features is None:
+            return np.zeros((len(rows), 0))
+        return self._features[rows]
+
+    def name(self, node_id):
+        return self._names[node_id]
+
+    def __contains__(self, node):
+        return node in self._ids
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def number_of_nodes(self):
+        return len(self._names)
+
+    # Edges
+
+    def add_edge(self, u, v, **attrs):
+        u_id = self._node_id(u)
+        v_id = self._node_id(v)
+        relation = attrs.get('relation')
+        if relation not in self._relations:
+            self._relations.append(relation)
+        self._src.append(u_id)
+        self._dst.append(v_id)
+        self._relation_codes.append(self._relations.index(relation))
+        self._csr = None
+
+    def add_edges_from(self, edges, **attrs):
+        for edge in edges:
+            if len(edge) == 3:
+                u, v, edge_attrs = edge
+                self.add_edge(u, v, **attrs, **edge_attrs)
+            else:
+                self.add_edge(*edge, **attrs)
+
+    def _ensure_csr(self):
+        if self._csr is not None:
+            return self._csr
+
+        n = len(self._names)
+        src = _to_numpy(self._src, np.int64)
+        dst = _to_numpy(self._dst, np.int64)
+        codes = _to_numpy(self._relation_codes, np.int8)
+
+        # Drop repeated edges, keeping first-insertion order and the latest attributes like networkx
+        keys = src * max(n, 1) + dst
+        unique_keys, first = np.unique(keys, return_index=True)
+        _, last_reversed = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last_reversed
+        order = np.argsort(first, kind='stable')
+        src, dst, codes = src[first[order]], dst[first[order]], codes[last[order]]
+
+        # Store the deduplicated edges so repeated add_edge calls don't accumulate
+        self._src, self._dst, self._relation_codes = _to_array('q', src), _to_array('q', dst), _to_array('b', codes)
+
+        out_order = np.argsort(src, kind='stable')
+        in_order = np.argsort(dst, kind='stable')
+        self._csr = {
+            'out_indptr': np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))]),
+            'out_indices': dst[out_order],
+            'out_relation': codes[out_order],
+            'in_indptr': np.concatenate([[0], np.cumsum(np.bincount(dst, minlength=n))]),
+            'in_indices': src[in_order],
+            'edge_src': src,
+            'edge_dst': dst,
+            'edge_relation': codes
+        }
+        return self._csr
+
+    def successor_ids(self, node_id):
+        csr = self._ensure_csr()
+        return csr['out_indices'][csr['out_indptr'][node_id]:csr['out_indptr'][node_id + 1]]
+
+    def predecessor_ids(self, node_id):
+        csr = self._ensure_csr()
+        return csr['in_indices'][csr['in_indptr'][node_id]:csr['in_indptr'][node_id + 1]]
+
+    def successors(self, node):
+        names = self._names
+        return iter([names[i] for i in self.successor_ids(self._ids[node])])
+
+    def predecessors(self, node):
+        names = self._names
+        return iter([names[i] for i in self.predecessor_ids(self._ids[node])])
+
+    def has_edge(self, u, v):
+        if u not in self._ids or v not in self._ids:
+            return False
+        return bool(np.any(self.successor_ids(self._ids[u]) == self._ids[v]))
+
+    def number_of_edges(self):
+        return len(self._ensure_csr()['edge_src'])
+
+    def edges(self, data=False):
+        csr = self._ensure_csr()
+        names = self._names
+        relations = self._relations
+        for u_id in range(len(names)):
+            for position in range(csr['out_indptr'][u_id], csr['out_indptr'][u_id + 1]):
+                v = names[csr['out_indices'][position]]
+                if data:
+                    relation = relations[csr['out_relation'][position]]
+                    yield names[u_id], v, ({} if relation is None else {'relation': relation})
+                else:
+                    yield names[u_id], v
+
+    def adjacency_matrix(self):
+        """n x n scipy CSR matrix of the (deduplicated) edges"""
+        csr = self._ensure_csr()
+        n = len(self._names)
+        return sparse.csr_matrix((np.ones(len(csr['out_indices'])), csr['out_indices'], csr['out_indptr']),
+                                 shape=(n, n))
+
+
+def hierarchy_adjacency(graph, embedding_dim):
+    """Boards, pins, board->pin and board->sub-board CSR matrices and the pin feature matrix"""
+    if isinstance(graph, CompactGraph):
+        board_ids = graph.node_ids('board')
+        pin_ids = graph.node_ids('pin')
+        adjacency = graph.adjacency_matrix()
+        board_rows = adjacency[board_ids]
+        return {
+            'boards': [graph.name(i) for i in board_ids],
+            'pins': [graph.name(i) for i in pin_ids],
+            'board_pins': board_rows[:, pin_ids].tocsr(),
+            'board_children': board_rows[:, board_ids].tocsr(),
+            'pin_features': graph.feature_matrix(pin_ids).reshape(len(pin_ids), embedding_dim)
+        }
+
+    node_types = graph.nodes(data='type')
+    boards = [node for node, node_type in node_types if node_type == 'board']
+    pins = [node for node, node_type in node_types if node_type == 'pin']
+    board_positions = {board: i for i, board in enumerate(boards)}
+    pin_positions = {pin: i for i, pin in enumerate(pins)}
+
+    pin_rows, pin_cols, child_rows, child_cols = [], [], [], []
+    for i, board in enumerate(boards):
+        for node in graph.successors(board):
+            if node in pin_positions:
+                pin_rows.append(i)
+                pin_cols.append(pin_positions[node])
+            elif node in board_positions:
+                child_rows.append(i)
+                child_cols.append(board_positions[node])
+
+    pin_features = np.array([graph.nodes[pin]['features'] for pin in pins], dtype=float)
+    return {
+        'boards': boards,
+        'pins': pins,
+        'board_pins': sparse.csr_matrix((np.ones(len(pin_rows)), (pin_rows, pin_cols)),
+                                        shape=(len(boards), len(pins))),
+        'board_children': sparse.csr_matrix((np.ones(len(child_rows)), (child_rows, child_cols)),
+                                            shape=(len(boards), len(boards))),
+        'pin_features': pin_features.reshape(len(pins), embedding_dim)
+    }
@@ -0,0 +1,103 @@
+"""Image decoding and the 224x224 crop step shared by catalog and query images.
+
+Preprocessing is split in two so the expensive half can be cached:
+
+    crop    decode, resize the shorter side to 224 and center-crop to a
+            (224, 224, 3) uint8 array
+    tensor  scale to [0, 1] and normalize with the ImageNet statistics
+
+fast_decode=True asks the JPEG decoder for a reduced-resolution image with
+Image.draft(), so a multi-megapixel photo is scaled by 1/2, 1/4 or 1/8 in
+the DCT domain and never fully decoded. The draft is never smaller than the
+224 pixel shorter side the resize needs. The embeddings differ very slightly
+from a full decode, so a catalog and its queries should use the same setting.
+Pillow's wheels ship libjpeg-turbo, which already runs the IDCT with SIMD;
+pillow-simd can be installed in its place for faster resizing.
+
+CropCache keeps the uint8 crops on disk, keyed by path, mtime, size and the
+decode settings, so re-embedding the catalog after a model change skips
+decoding entirely.
+"""
+import hashlib
+import math
+import os
+
+import numpy as np
+from PIL import Image
+from torchvision import transforms
+
+CROP_SIZE = 224
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def open_image(path, fast_decode=False, size=CROP_SIZE):
+    """Decode an image as RGB, at reduced resolution for large JPEGs if fast_decode"""
+    image = Image.open(path)
+    if fast_decode:
+        width, height = image.size
+        ratio = size / min(width, height)
+        if ratio < 1:
+            # Non-JPEG images ignore the draft request
+            image.draft('RGB', (math.ceil(width * ratio), math.ceil(height * ratio)))
+    return image.convert('RGB')
+
+
+def get_crop_transform(size=CROP_SIZE):
+    """PIL image -> resized and center-cropped PIL image"""
+    return transforms.Compose([
+        transforms.Resize(size),
+        transforms.CenterCrop(size)
+    ])
+
+
+def get_tensor_transform():
+    """Cropped image (PIL or HWC uint8 array) -> normalized (3, H, W) float tensor"""
+    return transforms.Compose([
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+
+
+def load_crop(path, fast_decode=False, size=CROP_SIZE):
+    """Decoded, resized and center-cropped image as a (size, size, 3) uint8 array"""
+    return np.array(get_crop_transform(size)(open_image(path, fast_decode, size)), dtype=np.uint8)
+
+
+class CropCache:
+    """On-disk cache of uint8 crops, one .npy file per image
+
+    Entries are keyed by the image's absolute path, mtime and size and by the
+    decode settings, so changed images and different settings miss the cache.
+    Writes go to a temporary file first, which makes the cache safe to share
+    between DataLoader workers.
+    """
+
+    def __init__(self, cache_dir, fast_decode=False, size=CROP_SIZE):
+        self.cache_dir = cache_dir
+        self.fast_decode = fast_decode
+        self.size = size
+
+    def _entry_path(self, path):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}|{int(self.fast_decode)}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}.npy')
+
+    def load(self, path):
+        """Crop of the image at path, from the cache or decoded and stored"""
+        entry_path = self._entry_path(path)
+        try:
+            crop = np.load(entry_path)
+            if crop.shape == (self.size, self.size, 3) and crop.dtype == np.uint8:
+                return crop
+        except (OSError, ValueError):
+            pass
+
+        crop = load_crop(path, self.fast_decode, self.size)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, crop)
+        os.replace(tmp_path, entry_path)
+        return crop
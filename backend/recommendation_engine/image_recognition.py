@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+from ann_index import AnnoyIndexWrapper, IVFIndex, QuantizedIndex, load_index, save_index
+from quantization import CODECS
+from embedding_store import open_store
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(__file__), 'embeddings')
+INDEX_DIR = 'ann_index'
+BACKEND_DIR = 'cnn_backend'
+
+_model = None
+
+
+class ImageRecognitionModel:
+    """Long-lived similarity search over the embedding store.
+
+    The store is memory-mapped once and an approximate nearest-neighbour index
+    is built (or loaded from the store directory) at start-up. The ResNet
+    feature extractor is only loaded when the first query image arrives.
+
+    index='float16', 'int8' or 'pq' keeps compressed codes in memory instead
+    and re-ranks the best rerank * k of them on the store's exact vectors.
+
+    backend picks the CNN inference backend (see inference.py); it is
+    calibrated and parity-checked on a sample of the catalog images the
+    first time and saved under the store directory for later processes.
+    fast_decode decodes query JPEGs at reduced resolution; use it when the
+    catalog was embedded with generate_embeddings.py --fast_decode.
+    """
+
+    def __init__(self, store_path=DEFAULT_STORE_PATH, index='ivf', n_lists=None, n_probe=8,
+                 n_trees=100, search_k=-1, rerank=4, n_subspaces=64, backend='eager',
+                 fast_decode=False):
+        self.store_path = store_path
+        self.backend = backend
+        self.fast_decode = fast_decode
+        self.store = open_store(store_path)
+        self.index_kind = index
+        if index == 'ivf':
+            self.search_params = {'n_probe': n_probe}
+            self.build_params = {'n_lists': n_lists}
+        elif index in CODECS:
+            self.search_params = {'rerank': rerank}
+            self.build_params = {'n_subspaces': n_subspaces} if index == 'pq' else {}
+        else:
+            self.search_params = {'search_k': search_k}
+            self.build_params = {'n_trees': n_trees}
+        self.index = self._load_or_build_index()
+        self._cnn = None
+        self._transform = None
+        self._cnn_lock = threading.Lock()
+
+    def _fingerprint(self):
+        # Appends and tombstones change these, and full rewrites drop the index directory
+        return {'count': self.store.count, 'tombstones': len(self.store.tombstones), **self.build_params}
+
+    def _load_or_build_index(self):
+        index_path = os.path.join(self.store_path, INDEX_DIR)
+        fingerprint = self._fingerprint()
+        index = load_index(index_path, fingerprint, self.index_kind, self.store.dim, exact=self.store.vectors,
+                           **self.search_params)
+        if index is not None:
+            logging.info(f"Loaded {self.index_kind} index with {len(index)} vectors")
+            return index
+
+        start = time.perf_counter()
+        live_rows = self.store.live_rows
+        vectors = self.store.vectors[live_rows]
+        if self.index_kind == 'ivf':
+            index = IVFIndex.build(vectors, ids=live_rows, n_lists=self.build_params['n_lists'],
+                                   n_probe=self.search_params['n_probe'])
+        elif self.index_kind == 'annoy':
+            index = AnnoyIndexWrapper.build(vectors, ids=live_rows, n_trees=self.build_params['n_trees'],
+                                            search_k=self.search_params['search_k'])
+        elif self.index_kind in CODECS:
+            index = QuantizedIndex.build(vectors, ids=live_rows, quantization=self.index_kind,
+                                         exact=self.store.vectors, rerank=self.search_params['rerank'],
+                                         **self.build_params)
+        else:
+            raise ValueError(f"Unknown index type '{self.index_kind}', expected one of "
+                             f"{('ivf', 'annoy') + CODECS}")
+
+        save_index(index, index_path, fingerprint)
+        logging.info(f"Built {self.index_kind} index with {len(index)} vectors "
+                     f"in {time.perf_counter() - start:.1f}s")
+        return index
+
+    def _load_cnn(self):
+        with self._cnn_lock:
+            if self._cnn is None:
+                # Imported here so index-only users never pay for torch
+                from generate_embeddings import load_extractor, get_transform
+                self._transform = get_transform()
+                live_rows = self.store.live_rows
+                sample_rows = live_rows[np.linspace(0, len(live_rows) - 1, min(64, len(live_rows))).astype(int)] \
+                    if len(live_rows) else []
+                # Calibrated and checked once per store; later processes load the saved backend
+                self._cnn = load_extractor(self.backend, [self.store.image_path(row) for row in sample_rows],
+                                           self._transform, cache_dir=os.path.join(self.store_path, BACKEND_DIR))
+        return self._cnn, self._transform
+
+    def warm_up(self):
+        """Load the feature extractor ahead of the first query"""
+        self._load_cnn()
+
+    def preprocess(self, image_path):
+        """Decode and transform a query image into a (3, 224, 224) tensor"""
+        from image_preprocessing import open_image
+
+        _, transform = self._load_cnn()
+        return transform(open_image(image_path, self.fast_decode))
+
+    def embed_batch(self, images):
+        """Embed a stacked (N, 3, 224, 224) batch of preprocessed images"""
+        import torch
+
+        model, _ = self._load_cnn()
+        with torch.inference_mode():
+            return model(images).flatten(1).numpy()
+
+    def embed_image(self, image_path):
+        """Embed a single query image with the catalog's feature extractor"""
+        return self.embed_batch(self.preprocess(image_path).unsqueeze(0))[0]
+
+    def find_similar_to_vector(self, vector, num_results=5, **search_params):
+        """Nearest catalog images to an embedding vector"""
+        ids, similarities = self.index.search(np.asarray(vector, dtype=np.float32), num_results, **search_params)
+        return [{
+            'image_path': self.store.image_path(row),
+            'label': self.store.label(row),
+            'similarity': float(similarity)
+        } for row, similarity in zip(ids.tolist(), similarities.tolist())]
+
+    def find_similar_images(self, image_path, num_results=5, **search_params):
+        """Nearest catalog images to a query image"""
+        return self.find_similar_to_vector(self.embed_image(image_path), num_results, **search_params)
+
+    def find_similar_to_centroid(self, image_paths, num_results=5, **search_params):
+        """Nearest catalog images to the centroid of several query images (e.g. an outfit)"""
+        centroid = np.mean([self.embed_image(path) for path in image_paths], axis=0)
+        return self.find_similar_to_vector(centroid, num_results, **search_params)
+
+
+def get_model(**kwargs):
+    """Return the process-wide model, creating it on first use"""
+    global _model
+    if _model is None:
+        _model = ImageRecognitionModel(**kwargs)
+    return _model
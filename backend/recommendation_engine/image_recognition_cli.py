@@ -1,15 +1,27 @@
 import argparse
 import json
 from image_recognition import get_model
+from inference import BACKENDS
+from quantization import CODECS
 
 def main():
     parser = argparse.ArgumentParser(description='Find similar images using content-based image retrieval')
     parser.add_argument('--image_path', required=True, help='Path to the query image')
     parser.add_argument('--num_results', type=int, default=5, help='Number of similar images to return')
+    parser.add_argument('--n_probe', type=int, default=8, help='Index partitions to scan (higher is slower but more accurate)')
+    parser.add_argument('--index', choices=('ivf', 'annoy') + CODECS, default='ivf',
+                        help='Index type; float16/int8/pq keep compressed vectors in memory')
+    parser.add_argument('--rerank', type=int, default=4,
+                        help='Candidates per result re-scored on exact vectors (quantized indexes)')
+    parser.add_argument('--backend', choices=BACKENDS, default='eager',
+                        help='CNN inference backend (see inference.py)')
+    parser.add_argument('--fast_decode', action='store_true',
+                        help='Decode query JPEGs at reduced resolution (match the catalog\'s setting)')
     args = parser.parse_args()
 
     # Get model and find similar images
-    model = get_model()
+    model = get_model(index=args.index, n_probe=args.n_probe, rerank=args.rerank, backend=args.backend,
+                      fast_decode=args.fast_decode)
     results = model.find_similar_images(args.image_path, args.num_results)
 
     # Print results as JSON
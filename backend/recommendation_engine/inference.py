@@ -0,0 +1,196 @@
+"""Selectable CPU inference backends for the ResNet-18 feature extractor.
+
+    eager          the nn.Module from generate_embeddings.load_model, float32
+    channels_last  same model with NHWC weights and inputs, which the oneDNN
+                   convolutions run faster
+    torchscript    channels-last model traced, frozen and optimized for inference
+    compile        torch.compile; the first batch pays for compilation
+    int8           static post-training int8 quantization (FX graph mode),
+                   calibrated on sample catalog images. Dynamic quantization
+                   only covers Linear/LSTM layers and the headless ResNet has
+                   none, so the convolutions are quantized statically instead.
+    onnx           ONNX export run with onnxruntime (pip install onnx onnxruntime)
+
+Every backend is a callable that takes an (N, 3, 224, 224) float tensor and
+returns an (N, 512, 1, 1) tensor, like the eager model, so embed_images and
+ImageRecognitionModel work with any of them.
+
+check_parity compares a backend with the eager model on sample images and
+raises when the lowest cosine similarity falls below the threshold; the
+int8 backend in particular should always be checked against real images.
+
+save_backend writes a checked backend (as TorchScript, or the ONNX file) to a
+directory and load_backend reads it back, so short-lived processes such as
+the image CLI pay for calibration and the parity check only once. compile
+can't be saved.
+"""
+import copy
+import json
+import os
+import shutil
+import tempfile
+
+import torch
+
+from embedding_store import atomic_directory
+
+BACKENDS = ('eager', 'channels_last', 'torchscript', 'compile', 'int8', 'onnx')
+SAVED_BACKENDS = ('channels_last', 'torchscript', 'int8', 'onnx')
+DEFAULT_PARITY_THRESHOLD = 0.99
+BACKEND_META_FILE = 'backend.json'
+
+
+def optimize_model(model, backend='eager', calibration=None, onnx_path=None):
+    """Wrap an eval-mode feature extractor in the requested inference backend
+
+    calibration is a batch of preprocessed images, required by 'int8' and
+    used as the example input when tracing or exporting. onnx_path is where
+    the ONNX export is written (a temporary file by default).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    example = calibration[:1] if calibration is not None else torch.randn(1, 3, 224, 224)
+
+    if backend == 'eager':
+        return model
+    if backend == 'channels_last':
+        return ChannelsLastModel(copy.deepcopy(model))
+    if backend == 'torchscript':
+        channels_last = copy.deepcopy(model).to(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            traced = torch.jit.trace(channels_last, example.contiguous(memory_format=torch.channels_last))
+        return ChannelsLastModel(_optimize_traced(traced), traced=traced)
+    if backend == 'compile':
+        return torch.compile(copy.deepcopy(model))
+    if backend == 'int8':
+        if calibration is None:
+            raise ValueError("The int8 backend needs a batch of catalog images for calibration")
+        return _quantize_static(model, calibration)
+    return _export_onnx(model, example, onnx_path)
+
+
+class ChannelsLastModel:
+    """Runs a model with channels-last (NHWC) weights and inputs"""
+
+    def __init__(self, model, traced=None):
+        self.model = model.to(memory_format=torch.channels_last) if isinstance(model, torch.nn.Module) else model
+        # Unfrozen TorchScript module behind an optimized model; save_backend writes this one
+        self.traced = traced
+
+    def __call__(self, images):
+        return self.model(images.contiguous(memory_format=torch.channels_last))
+
+
+class OnnxModel:
+    """Runs an exported ONNX feature extractor with onnxruntime"""
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime
+
+        self.path = path
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, images):
+        output = self.session.run(None, {self.input_name: images.numpy()})[0]
+        return torch.from_numpy(output)
+
+
+def check_parity(model, reference, images, threshold=DEFAULT_PARITY_THRESHOLD):
+    """Lowest cosine similarity between model and reference embeddings of images
+
+    Raises ValueError if it is below threshold.
+    """
+    with torch.inference_mode():
+        expected = reference(images).flatten(1)
+        actual = model(images).flatten(1)
+    similarity = float(torch.nn.functional.cosine_similarity(actual, expected, dim=1).min())
+    if similarity < threshold:
+        raise ValueError(f"Inference backend embeddings drifted from the reference: "
+                         f"min cosine similarity {similarity:.4f} < {threshold}")
+    return similarity
+
+
+def save_backend(model, backend, path, example, similarity, pretrained=True):
+    """Write a parity-checked backend to the directory path; False if the backend can't be saved"""
+    if backend not in SAVED_BACKENDS:
+        return False
+    with atomic_directory(path) as tmp_path:
+        if backend == 'onnx':
+            shutil.copyfile(model.path, os.path.join(tmp_path, 'model.onnx'))
+        else:
+            module = model
+            if isinstance(model, ChannelsLastModel):
+                # Graphs rewritten by optimize_for_inference can't be loaded back, so save the trace
+                module = model.traced if model.traced is not None else model.model
+            if not isinstance(module, torch.jit.ScriptModule):
+                if backend == 'channels_last':
+                    example = example.contiguous(memory_format=torch.channels_last)
+                with torch.no_grad():
+                    module = torch.jit.trace(module, example)
+            torch.jit.save(module, os.path.join(tmp_path, 'model.pt'))
+        with open(os.path.join(tmp_path, BACKEND_META_FILE), 'w') as f:
+            json.dump({'backend': backend, 'torch': torch.__version__, 'engine': torch.backends.quantized.engine,
+                       'pretrained': pretrained, 'similarity': similarity}, f)
+    return True
+
+
+def load_backend(path, backend, parity_threshold=DEFAULT_PARITY_THRESHOLD, pretrained=True):
+    """Backend saved by save_backend, or None if there is none matching the request
+
+    A saved backend is only reused by the same torch version and when its
+    recorded parity meets parity_threshold.
+    """
+    meta_path = os.path.join(str(path), BACKEND_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if (meta['backend'] != backend or meta['torch'] != torch.__version__ or meta['pretrained'] != pretrained or
+            meta['similarity'] < parity_threshold):
+        return None
+
+    if backend == 'onnx':
+        return OnnxModel(os.path.join(path, 'model.onnx'), num_threads=torch.get_num_threads())
+    if backend == 'int8':
+        torch.backends.quantized.engine = meta['engine']
+    module = torch.jit.load(os.path.join(path, 'model.pt'))
+    if backend == 'int8':
+        return module
+    if backend == 'torchscript':
+        return ChannelsLastModel(_optimize_traced(module), traced=module)
+    return ChannelsLastModel(module)
+
+
+def _optimize_traced(traced):
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+def _quantize_static(model, calibration):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(model), get_default_qconfig_mapping(engine), example_inputs=(calibration[:1],))
+    with torch.inference_mode():
+        prepared(calibration)
+    return convert_fx(prepared)
+
+
+def _export_onnx(model, example, onnx_path=None):
+    try:
+        import onnx  # noqa: F401  (needed by the exporter)
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError("The onnx backend needs the onnx and onnxruntime packages "
+                          "(pip install onnx onnxruntime)") from e
+
+    if onnx_path is None:
+        onnx_path = os.path.join(tempfile.mkdtemp(prefix='resnet18_'), 'resnet18.onnx')
+    torch.onnx.export(model, example, onnx_path, input_names=['images'], output_names=['embeddings'],
+                      dynamic_axes={'images': {0: 'batch'}, 'embeddings': {0: 'batch'}}, dynamo=False)
+    return OnnxModel(onnx_path, num_threads=torch.get_num_threads())
@@ -0,0 +1,63 @@
+"""On-disk layout for a built PinSageHierarchical model.
+
+A model directory holds:
+
+    meta.json          format version, model settings, board names/levels
+                       and clustering results
+    <name>.npy         one file per array (pin names, pin feature matrix,
+                       board embeddings, CSR board->pin and board->sub-board
+                       adjacency, cluster labels)
+    transformers.pkl   fitted scaler, vectorizer, projection and cluster
+                       models, only unpickled when first needed
+
+Arrays are opened with np.load(mmap_mode='r'), so reading a model only parses
+meta.json and the pages of each matrix are shared by every process that maps
+it. Nothing here imports sklearn; unpickling the transformers does.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+
+from embedding_store import atomic_directory
+
+MODEL_VERSION = 1
+
+META_FILE = 'meta.json'
+TRANSFORMERS_FILE = 'transformers.pkl'
+
+
+def write_model(path, meta, arrays, transformers=None):
+    """Write a complete model directory, replacing any existing one at path"""
+    with atomic_directory(path) as tmp_path:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), np.ascontiguousarray(array))
+        if transformers:
+            with open(os.path.join(tmp_path, TRANSFORMERS_FILE), 'wb') as f:
+                pickle.dump(transformers, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+            json.dump({**meta, 'version': MODEL_VERSION, 'arrays': sorted(arrays)}, f)
+
+
+def read_model(path, mmap=True):
+    """Return (meta, arrays, transformers_path) of a model directory.
+
+    transformers_path is None when the model was saved without fitted
+    transformers.
+    """
+    path = str(path)
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('version') != MODEL_VERSION:
+        raise ValueError(f"Unsupported model version {meta.get('version')} in {path}")
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in meta['arrays']}
+    transformers_path = os.path.join(path, TRANSFORMERS_FILE)
+    return meta, arrays, transformers_path if os.path.exists(transformers_path) else None
+
+
+def read_transformers(transformers_path):
+    with open(transformers_path, 'rb') as f:
+        return pickle.load(f)
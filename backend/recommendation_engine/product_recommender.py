@@ -1,35 +1,190 @@
+# Training, plotting and download dependencies (sklearn, joblib, matplotlib, seaborn,
+# networkx, kagglehub, nltk) are imported inside the functions that use them, so
+# loading a saved model and serving recommendations only pays for numpy, pandas
+# and scipy. board_index.BoardIndex serves saved models with numpy alone.
 import numpy as np
 import pandas as pd
-import networkx as nx
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.cluster import KMeans
-from sklearn.manifold import TSNE
-from sklearn.metrics import silhouette_score
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import PCA
-from sklearn.model_selection import KFold
-from sklearn.preprocessing import StandardScaler
+from scipy import sparse
+import heapq
+import json
 import os
-import kagglehub
-import nltk
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import warnings
 from pathlib import Path
 import logging
+from ann_index import IVFIndex, assign_to_centroids, l2_normalize, normalize_rows
+from board_index import BoardIndex, board_neighbours, child_positions, rank_rows
+from graph_backend import GRAPH_BACKENDS, create_graph, hierarchy_adjacency
+from model_store import read_model, read_transformers, write_model
+
+DATASET_SUFFIXES = ('.csv', '.json', '.jsonl', '.parquet')
+VISUALIZATION_PANELS = ('silhouette', 'clusters', 'levels', 'hierarchy', 'similarity', 'level_clusters')
+PRODUCT_FEATURE_COLUMNS = ('price', 'rating', 'numReviews', 'countInStock')
+
+# Fitted objects that save() pickles and a loaded model unpickles on first use
+TRANSFORMER_ATTRIBUTES = ('scaler', 'tfidf', 'projection', 'category_model', 'sub_category_models',
+                          'cluster_models', 'numerical_cols', 'text_cols', 'category_cols', 'chunk_size')
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class PinSageHierarchical:
-    def __init__(self, embedding_dim=16, random_seed=42):
+    def __init__(self, embedding_dim=16, random_seed=42, graph_backend='networkx'):
         self.embedding_dim = embedding_dim
         self.random_seed = random_seed
-        self.graph = nx.DiGraph()
+        if graph_backend not in GRAPH_BACKENDS:
+            raise ValueError(f"Unknown graph backend '{graph_backend}', expected one of {GRAPH_BACKENDS}")
+        self.graph_backend = graph_backend
+        self._graph = None
+        # Bumped on every graph mutation; the cached adjacency is keyed on it
+        self._graph_version = 0
+        self._adjacency = None
         self.board_embeddings = {}
+        self.embedding_params = None
+        self._board_sums = None
+        self._pin_index = None
+        self._board_quantization = {'quantization': None}
         np.random.seed(self.random_seed)
 
-    def load_ecommerce_dataset(self, file_path, max_items=5000):
-        """Load and process e-commerce dataset"""
+    @property
+    def graph(self):
+        # Created on first use (networkx is imported then); a loaded model rebuilds its saved graph
+        if self._graph is None:
+            self._graph = create_graph(self.graph_backend) if self._adjacency is None else self._restore_graph()
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph = graph
+        self._graph_version += 1
+
+    def __getattr__(self, name):
+        # Fitted transformers of a loaded model are unpickled on first access
+        transformers_path = self.__dict__.get('_transformers_path')
+        if name in TRANSFORMER_ATTRIBUTES and transformers_path:
+            self._transformers_path = None
+            for attr, value in read_transformers(transformers_path).items():
+                setattr(self, attr, value)
+            return getattr(self, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def save(self, path):
+        """Write the built model to a directory that load() memory-maps back"""
+        adjacency = self._hierarchy_adjacency()
+        boards = list(adjacency['boards'])
+        board_nodes = [self.graph.nodes[board] for board in boards]
+        embedded_boards = list(self.board_embeddings)
+
+        arrays = {
+            'pins': np.asarray(adjacency['pins'], dtype=str),
+            'pin_features': adjacency['pin_features'],
+            'board_pins_indptr': adjacency['board_pins'].indptr,
+            'board_pins_indices': adjacency['board_pins'].indices,
+            'board_children_indptr': adjacency['board_children'].indptr,
+            'board_children_indices': adjacency['board_children'].indices,
+            'board_embeddings': np.array([self.board_embeddings[board] for board in embedded_boards],
+                                         dtype=float).reshape(len(embedded_boards), self.embedding_dim)
+        }
+        meta = {
+            'embedding_dim': self.embedding_dim,
+            'random_seed': self.random_seed,
+            'graph_backend': self.graph_backend,
+            'boards': boards,
+            'board_levels': [node.get('level') for node in board_nodes],
+            'board_display_names': [node.get('name') for node in board_nodes],
+            'embedded_boards': embedded_boards,
+            'embedding_params': self.embedding_params
+        }
+        if getattr(self, 'clusters', None) is not None:
+            arrays['clusters'] = np.asarray(self.clusters)
+            meta['clustering'] = {
+                'board_names': list(self.board_names),
+                'optimal_k': int(self.optimal_k),
+                'silhouette_scores': [float(score) for score in self.silhouette_scores],
+                'k_range': [int(k) for k in self.k_range],
+                'k_timings': {str(k): seconds for k, seconds in getattr(self, 'k_timings', {}).items()}
+            }
+
+        transformers = {attr: getattr(self, attr) for attr in TRANSFORMER_ATTRIBUTES if hasattr(self, attr)}
+        write_model(path, meta, arrays, transformers)
+        logging.info(f"Saved model with {len(boards)} boards and {len(arrays['pins'])} pins to {path}")
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model written by save() without rebuilding the graph or refitting anything"""
+        meta, arrays, transformers_path = read_model(path, mmap=mmap)
+        model = cls(embedding_dim=meta['embedding_dim'], random_seed=meta['random_seed'],
+                    graph_backend=meta['graph_backend'])
+        model._transformers_path = transformers_path
+
+        boards = meta['boards']
+        pins = arrays['pins']
+        model._adjacency = {
+            'boards': boards,
+            'pins': pins,
+            'board_pins': _csr_from_arrays(arrays['board_pins_indptr'], arrays['board_pins_indices'],
+                                           (len(boards), len(pins))),
+            'board_children': _csr_from_arrays(arrays['board_children_indptr'], arrays['board_children_indices'],
+                                               (len(boards), len(boards))),
+            'pin_features': arrays['pin_features'],
+            'key': None
+        }
+        model._board_levels = meta['board_levels']
+        model._board_display_names = meta['board_display_names']
+
+        embeddings = arrays['board_embeddings']
+        model.board_embeddings = {board: embeddings[i] for i, board in enumerate(meta['embedded_boards'])}
+        model.embedding_params = meta.get('embedding_params')
+
+        clustering = meta.get('clustering')
+        if clustering is not None:
+            model.clusters = arrays['clusters']
+            model.board_names = clustering['board_names']
+            model.embeddings_array = np.array([model.board_embeddings[board] for board in model.board_names])
+            model.optimal_k = clustering['optimal_k']
+            model.silhouette_scores = clustering['silhouette_scores']
+            model.k_range = clustering['k_range']
+            model.k_timings = {int(k): seconds for k, seconds in clustering['k_timings'].items()}
+
+        if model.board_embeddings:
+            model._build_board_index()
+        return model
+
+    def _restore_graph(self):
+        """Rebuild the pin/board graph of a loaded model from its saved adjacency"""
+        adjacency = self._adjacency
+        boards, pins = adjacency['boards'], [str(pin) for pin in adjacency['pins']]
+        graph = create_graph(self.graph_backend)
+        graph.add_nodes_from((pin, {'type': 'pin', 'features': features})
+                             for pin, features in zip(pins, np.asarray(adjacency['pin_features'])))
+        graph.add_nodes_from((board, {'type': 'board', 'level': level, 'name': name})
+                             for board, level, name in zip(boards, self._board_levels, self._board_display_names))
+
+        board_pins, board_children = adjacency['board_pins'], adjacency['board_children']
+        self.board_hierarchy = {}
+        for i, board in enumerate(boards):
+            board_pin_names = [pins[j] for j in board_pins.indices[board_pins.indptr[i]:board_pins.indptr[i + 1]]]
+            sub_boards = [boards[j] for j in board_children.indices[board_children.indptr[i]:board_children.indptr[i + 1]]]
+            graph.add_edges_from((board, pin, {'relation': 'contains'}) for pin in board_pin_names)
+            graph.add_edges_from((board, sub_board, {'relation': 'parent'}) for sub_board in sub_boards)
+            self.board_hierarchy[board] = {"pins": board_pin_names, "sub_boards": sub_boards,
+                                           "level": self._board_levels[i]}
+
+        adjacency['key'] = self._graph_version
+        return graph
+
+    def load_ecommerce_dataset(self, file_path, max_items=5000, chunk_size=50000, columns=None, dtype=None,
+                               download_nltk=True):
+        """Load and process e-commerce dataset
+
+        Files are read in chunks of chunk_size rows and reading stops once
+        max_items rows are collected (None reads everything). A directory is
+        read file by file in name order. columns limits the columns kept and
+        dtype is passed to the readers as explicit column types.
+        download_nltk=False skips fetching the NLTK corpora, for offline runs.
+        """
         logging.info(f"Loading data from {file_path}...")
 
         try:
@@ -38,29 +193,44 @@ class PinSageHierarchical:
                 raise FileNotFoundError(f"File or directory {file_path} does not exist")
 
             if file_path.is_dir():
-                csv_files = list(file_path.glob("*.csv"))
-                if not csv_files:
-                    raise ValueError("No CSV files found in the dataset folder")
-                file_path = csv_files[0]  # Use the first CSV file found
-                logging.info(f"Using CSV file: {file_path}")
-
-            if file_path.suffix == '.csv':
-                df = pd.read_csv(file_path, nrows=max_items)
-            elif file_path.suffix == '.json':
-                df = pd.read_json(file_path, lines=True)[:max_items]
+                files = sorted(path for path in file_path.iterdir() if path.suffix in DATASET_SUFFIXES)
+                if not files:
+                    raise ValueError("No CSV, JSON or Parquet files found in the dataset folder")
+            elif file_path.suffix in DATASET_SUFFIXES:
+                files = [file_path]
             else:
-                raise ValueError("Unsupported file format. Please provide CSV or JSON file.")
+                raise ValueError("Unsupported file format. Please provide CSV, JSON or Parquet file.")
+
+            chunks = []
+            remaining = max_items
+            for path in files:
+                logging.info(f"Reading {path}")
+                for chunk in _iter_dataset_chunks(path, chunk_size, columns, dtype):
+                    if remaining is not None:
+                        chunk = chunk.iloc[:remaining]
+                        remaining -= len(chunk)
+                    chunks.append(chunk)
+                    if remaining == 0:
+                        break
+                if remaining == 0:
+                    break
+
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
 
             logging.info(f"Data loaded with {len(df)} rows")
             logging.info(f"Columns: {df.columns.tolist()}")
 
             # Download necessary NLTK data
-            for resource in ['punkt', 'stopwords']:
-                try:
-                    nltk.data.find(f'tokenizers/{resource}' if resource == 'punkt' else f'corpora/{resource}')
-                except LookupError:
-                    logging.info(f"Downloading NLTK {resource}...")
-                    nltk.download(resource)
+            if download_nltk:
+                # Imported here so offline loads don't pay for importing nltk
+                import nltk
+
+                for resource in ['punkt', 'stopwords']:
+                    try:
+                        nltk.data.find(f'tokenizers/{resource}' if resource == 'punkt' else f'corpora/{resource}')
+                    except LookupError:
+                        logging.info(f"Downloading NLTK {resource}...")
+                        nltk.download(resource)
 
             return df
 
@@ -68,8 +238,27 @@ class PinSageHierarchical:
             logging.error(f"Error loading dataset: {e}")
             raise
 
-    def process_ecommerce_data(self, df):
-        """Process e-commerce data and create the graph"""
+    def process_ecommerce_data(self, df, clustering='kmeans', chunk_size=10000, n_jobs=1, projection='pca',
+                               max_features=50):
+        """Process e-commerce data and create the graph
+
+        clustering='minibatch' fits the main and sub categories with
+        MiniBatchKMeans.partial_fit over chunk_size rows at a time instead of
+        full-batch KMeans. Sub-categories are fitted n_jobs categories at a
+        time. The fitted scaler and cluster models are kept so that
+        predict_categories can place new products without reclustering.
+
+        Pin features are the scaled numeric columns next to a sparse TF-IDF
+        matrix of up to max_features terms, reduced to embedding_dim by
+        projection: 'pca' (exact, dense), 'svd' (TruncatedSVD straight on the
+        sparse matrix, uncentered) or 'incremental' (IncrementalPCA over
+        chunk_size-row chunks). The fitted scaler, vectorizer and projection
+        are kept for embed_products.
+        """
+        from joblib import Parallel, delayed
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.preprocessing import StandardScaler
+
         logging.info("Processing data and creating graph structure...")
 
         try:
@@ -99,17 +288,11 @@ class PinSageHierarchical:
 
             # Create category string from available categorical columns
             available_cat_cols = [col for col in categorical_cols if col in df.columns]
-            df['category_string'] = df[available_cat_cols].apply(
-                lambda row: ' | '.join([f"{col}:{str(row[col])}" for col in available_cat_cols if pd.notna(row[col])]),
-                axis=1
-            )
+            df['category_string'] = _join_columns(df, available_cat_cols, ' | ', with_names=True)
 
             # Create feature string from text columns
             available_text_cols = [col for col in text_cols if col in df.columns]
-            df['feature_string'] = df[available_text_cols].apply(
-                lambda row: ' '.join([str(row[col]) for col in available_text_cols if pd.notna(row[col])]),
-                axis=1
-            )
+            df['feature_string'] = _join_columns(df, available_text_cols, ' ')
 
             # Create numerical features
             numerical_features = df[numerical_cols].fillna(0).values
@@ -118,51 +301,57 @@ class PinSageHierarchical:
 
             # Cluster products to create categories
             n_clusters = min(10, max(3, len(df) // 100))
-            kmeans_categories = KMeans(n_clusters=n_clusters, random_state=self.random_seed, n_init=10)
-            df['main_category'] = kmeans_categories.fit_predict(scaled_features)
-
-            # Create subcategories
-            df['sub_category'] = -1
-            for category in df['main_category'].unique():
-                category_mask = df['main_category'] == category
-                category_count = category_mask.sum()
-
-                if category_count >= 10:
-                    sub_n_clusters = min(3, category_count // 5)
-                    sub_features = scaled_features[category_mask]
-                    sub_kmeans = KMeans(n_clusters=sub_n_clusters, random_state=self.random_seed, n_init=10)
-                    df.loc[category_mask, 'sub_category'] = sub_kmeans.fit_predict(sub_features)
-                else:
-                    df.loc[category_mask, 'sub_category'] = 0
+            self.category_model = _fit_category_model(scaled_features, n_clusters, clustering, self.random_seed,
+                                                      chunk_size)
+            main_category = _predict_in_chunks(self.category_model, scaled_features, chunk_size)
+            df['main_category'] = main_category
+
+            # Create subcategories, one independent fit per main category
+            # Categories with fewer than 10 products keep a single sub-category 0
+            members = {category: np.flatnonzero(main_category == category) for category in pd.unique(main_category)}
+            members = {category: rows for category, rows in members.items() if len(rows) >= 10}
+            sub_models = Parallel(n_jobs=n_jobs)(
+                delayed(_fit_category_model)(scaled_features[rows], min(3, len(rows) // 5), clustering,
+                                             self.random_seed, chunk_size)
+                for rows in members.values())
+
+            sub_category = np.zeros(len(df), dtype=int)
+            for rows, model in zip(members.values(), sub_models):
+                sub_category[rows] = _predict_in_chunks(model, scaled_features[rows], chunk_size)
+            df['sub_category'] = sub_category
+
+            self.scaler = scaler
+            self.numerical_cols = numerical_cols
+            self.sub_category_models = dict(zip(members, sub_models))
+            self.chunk_size = chunk_size
 
             # Create hierarchical category structure
-            df['category_hierarchy'] = df.apply(
-                lambda row: [
-                    f"category_{row['main_category']}",
-                    f"subcategory_{row['main_category']}_{row['sub_category']}"
-                ],
-                axis=1
-            )
+            main_names = 'category_' + df['main_category'].astype(str)
+            sub_names = 'subcategory_' + df['main_category'].astype(str) + '_' + df['sub_category'].astype(str)
+            df['category_hierarchy'] = [list(pair) for pair in zip(main_names, sub_names)]
 
             # Generate pin features
             logging.info("Generating pin features...")
-            base_features = scaled_features
 
             # Add TF-IDF features if text data is available
             text_data = df['feature_string'].fillna('') + ' ' + df['category_string'].fillna('')
-            tfidf_features = np.zeros((len(df), 1))  # Default empty features
+            self.tfidf = None
+            tfidf_features = sparse.csr_matrix((len(df), 1))  # Default empty features
             if text_data.str.strip().str.len().sum() > 0:  # Check if there's meaningful text
-                tfidf = TfidfVectorizer(max_features=min(50, len(df) // 10), stop_words='english')
-                tfidf_features = tfidf.fit_transform(text_data).toarray()
+                self.tfidf = TfidfVectorizer(max_features=min(max_features, len(df) // 10), stop_words='english')
+                tfidf_features = self.tfidf.fit_transform(text_data)
 
-            combined_features = np.hstack([base_features, tfidf_features])
+            # Kept sparse: the scaled numeric block is narrow, the TF-IDF block is mostly zeros
+            combined_features = sparse.hstack([sparse.csr_matrix(scaled_features), tfidf_features]).tocsr()
 
             # Reduce dimensions
             max_components = min(self.embedding_dim, combined_features.shape[1], len(df))
-            logging.info(f"Reducing to {max_components} features via PCA")
+            logging.info(f"Reducing to {max_components} features via {projection}")
 
-            pca = PCA(n_components=max_components)
-            pin_features_reduced = pca.fit_transform(combined_features)
+            self.projection, pin_features_reduced = _fit_projection(
+                combined_features, max_components, projection, self.random_seed, chunk_size)
+            self.text_cols = available_text_cols
+            self.category_cols = available_cat_cols
 
             # Pad features if necessary
             pin_features = np.zeros((len(df), self.embedding_dim))
@@ -172,44 +361,24 @@ class PinSageHierarchical:
 
             # Build graph
             logging.info("Building graph with pins and boards...")
-            for i, row in df.iterrows():
-                pin_id = f"pin_{row[product_id_col]}"
-                self.graph.add_node(pin_id, type="pin", features=pin_features[i])
+            pin_ids = ('pin_' + df[product_id_col].astype(str)).to_numpy(dtype=object)
+            self.graph.add_nodes_from(
+                (pin_id, {'type': 'pin', 'features': features}) for pin_id, features in zip(pin_ids, pin_features))
 
             # Create board hierarchy
-            board_hierarchy = {}
-            for i, row in df.iterrows():
-                categories = row['category_hierarchy']
-                pin_id = f"pin_{row[product_id_col]}"
-
-                parent_board = None
-                for level, category in enumerate(categories):
-                    board_id = f"board_{level}_{category}"
-
-                    if board_id not in board_hierarchy:
-                        board_hierarchy[board_id] = {"pins": [], "sub_boards": [], "level": level}
-                        self.graph.add_node(board_id, type="board", level=level, name=category)
-
-                    board_hierarchy[board_id]["pins"].append(pin_id)
-                    self.graph.add_edge(board_id, pin_id, relation="contains")
-
-                    if parent_board:
-                        if board_id not in board_hierarchy[parent_board]["sub_boards"]:
-                            board_hierarchy[parent_board]["sub_boards"].append(board_id)
-                        self.graph.add_edge(parent_board, board_id, relation="parent")
-
-                    parent_board = board_id
-
+            board_hierarchy = self._add_board_hierarchy(
+                pin_ids, main_names.to_numpy(dtype=object), sub_names.to_numpy(dtype=object))
             self.board_hierarchy = board_hierarchy
+            self._graph_version += 1
 
             # Print summary
-            board_count = len([n for n in self.graph.nodes() if self.graph.nodes[n].get('type') == 'board'])
-            pin_count = len([n for n in self.graph.nodes() if self.graph.nodes[n].get('type') == 'pin'])
+            node_types = [node_type for _, node_type in self.graph.nodes(data='type')]
+            board_count = node_types.count('board')
+            pin_count = node_types.count('pin')
             edge_count = self.graph.number_of_edges()
 
             logging.info(f"Graph created with {board_count} boards, {pin_count} pins, and {edge_count} edges")
-            max_level = max([self.graph.nodes[n].get('level', 0) for n in self.graph.nodes()
-                           if self.graph.nodes[n].get('type') == 'board'], default=0)
+            max_level = max((level for _, level in self.graph.nodes(data='level') if level is not None), default=0)
             logging.info(f"Maximum hierarchy depth: {max_level + 1} levels")
 
             return board_hierarchy
@@ -218,100 +387,460 @@ class PinSageHierarchical:
             logging.error(f"Error processing data: {e}")
             raise
 
+    def predict_categories(self, df):
+        """Main and sub category of new products from the fitted scaler and cluster models"""
+        features = self.scaler.transform(df.reindex(columns=self.numerical_cols).fillna(0).values)
+        main_category = _predict_in_chunks(self.category_model, features, self.chunk_size)
+
+        sub_category = np.zeros(len(df), dtype=int)
+        for category in pd.unique(main_category):
+            model = self.sub_category_models.get(category)
+            if model is not None:
+                rows = np.flatnonzero(main_category == category)
+                sub_category[rows] = _predict_in_chunks(model, features[rows], self.chunk_size)
+        return pd.DataFrame({'main_category': main_category, 'sub_category': sub_category}, index=df.index)
+
+    def embed_products(self, df):
+        """Pin feature vectors for new products from the fitted scaler, vectorizer and projection"""
+        scaled_features = self.scaler.transform(df.reindex(columns=self.numerical_cols).fillna(0).values)
+
+        tfidf_features = sparse.csr_matrix((len(df), 1))
+        if self.tfidf is not None:
+            category_string = _join_columns(df.reindex(columns=self.category_cols), self.category_cols, ' | ',
+                                            with_names=True)
+            feature_string = _join_columns(df.reindex(columns=self.text_cols), self.text_cols, ' ')
+            tfidf_features = self.tfidf.transform(feature_string + ' ' + category_string)
+
+        combined_features = sparse.hstack([sparse.csr_matrix(scaled_features), tfidf_features]).tocsr()
+        reduced = _project_in_chunks(self.projection, combined_features, self.chunk_size)
+
+        pin_features = np.zeros((len(df), self.embedding_dim))
+        pin_features[:, :reduced.shape[1]] = reduced
+        return pin_features
+
+    def add_pins(self, df):
+        """Add new products to the graph and refresh only the boards they land in.
+
+        Rows are embedded with the fitted scaler, vectorizer and projection
+        and assigned to boards by the fitted cluster models, so nothing is
+        refitted. Each board keeps a running sum and count of its pins'
+        features; only the boards receiving pins and their ancestors are
+        re-embedded and updated in the similarity index. Returns the new pin
+        ids.
+        """
+        if 'product_id' not in df.columns:
+            raise ValueError("add_pins needs a product_id column")
+        df = df.dropna(subset=['product_id'])
+        pin_ids = ('pin_' + df['product_id'].astype(str)).to_numpy(dtype=object)
+        existing = [pin for pin in pin_ids if pin in self.graph]
+        if existing:
+            raise ValueError(f"Pin '{existing[0]}' already exists")
+        if len(set(pin_ids)) != len(pin_ids):
+            raise ValueError("Duplicate product IDs in the new rows")
+
+        features = self.embed_products(df)
+        categories = self.predict_categories(df)
+        main_names = ('category_' + categories['main_category'].astype(str)).to_numpy(dtype=object)
+        sub_names = ('subcategory_' + categories['main_category'].astype(str) + '_' +
+                     categories['sub_category'].astype(str)).to_numpy(dtype=object)
+
+        self._ensure_board_sums()
+        self.graph.add_nodes_from(
+            (pin_id, {'type': 'pin', 'features': pin_features}) for pin_id, pin_features in zip(pin_ids, features))
+        for board, info in self._add_board_hierarchy(pin_ids, main_names, sub_names).items():
+            current = self.board_hierarchy.setdefault(board, {"pins": [], "sub_boards": [], "level": info["level"]})
+            current["pins"].extend(info["pins"])
+            current["sub_boards"].extend(sub for sub in info["sub_boards"] if sub not in current["sub_boards"])
+        self._graph_version += 1
+
+        boards = np.concatenate(['board_0_' + main_names, 'board_1_' + sub_names])
+        self._update_board_sums(boards, np.vstack([features, features]), sign=1)
+        logging.info(f"Added {len(pin_ids)} pins")
+        return list(pin_ids)
+
+    def remove_pins(self, product_ids):
+        """Remove products from the graph and refresh only the boards that held them"""
+        # Each pin's features must leave the running sums only once
+        pin_ids = list(dict.fromkeys(f"pin_{product_id}" for product_id in product_ids))
+        missing = [pin for pin in pin_ids if pin not in self.graph]
+        if missing:
+            raise ValueError(f"Pin '{missing[0]}' not found")
+
+        self._ensure_board_sums()
+        boards, features = [], []
+        for pin in pin_ids:
+            pin_features = self.graph.nodes[pin]['features']
+            for board in self.graph.predecessors(pin):
+                boards.append(board)
+                features.append(pin_features)
+
+        removed = set(pin_ids)
+        for board in set(boards):
+            self.board_hierarchy[board]["pins"] = [pin for pin in self.board_hierarchy[board]["pins"]
+                                                   if pin not in removed]
+        self.graph.remove_nodes_from(pin_ids)
+        self._graph_version += 1
+
+        if boards:
+            self._update_board_sums(np.array(boards, dtype=object), np.array(features, dtype=float), sign=-1)
+        logging.info(f"Removed {len(pin_ids)} pins")
+
+    def _ensure_board_sums(self):
+        """Per-board pin feature sums and counts, taken from the current graph"""
+        if self._board_sums is not None:
+            return
+        adjacency = self._hierarchy_adjacency()
+        sums = adjacency['board_pins'] @ adjacency['pin_features']
+        counts = adjacency['board_pins'].getnnz(axis=1)
+        self._board_sums = dict(zip(adjacency['boards'], sums))
+        self._board_counts = dict(zip(adjacency['boards'], counts.tolist()))
+
+    def _update_board_sums(self, boards, features, sign):
+        """Apply pin additions (sign=1) or removals (sign=-1) and re-embed the affected boards"""
+        grouped = pd.DataFrame(features).groupby(boards, sort=False)
+        sums = grouped.sum()
+        for board, board_sum, count in zip(sums.index, sums.to_numpy(), grouped.size()):
+            self._board_sums[board] = self._board_sums.get(board, np.zeros(self.embedding_dim)) + sign * board_sum
+            self._board_counts[board] = self._board_counts.get(board, 0) + sign * count
+
+        self._pin_index = None
+        if self.embedding_params is None:
+            return  # No embeddings yet; generate_embeddings will compute them
+
+        parents = {}
+        for board, info in self.board_hierarchy.items():
+            for sub_board in info["sub_boards"]:
+                parents.setdefault(sub_board, []).append(board)
+        affected, stack = set(), list(sums.index)
+        while stack:
+            board = stack.pop()
+            if board not in affected:
+                affected.add(board)
+                stack.extend(parents.get(board, []))
+
+        alpha, max_depth = self.embedding_params['alpha'], self.embedding_params['max_depth']
+        affected = sorted(affected)
+        for board in affected:
+            self.board_embeddings[board] = self._running_embedding(board, alpha, max_depth + 1)
+
+        index = getattr(self, '_board_index', None)
+        if index is not None and all(board in index for board in affected):
+            index.update(affected, [self.board_embeddings[board] for board in affected])
+        else:
+            self._build_board_index()
+
+    def _running_embedding(self, board, alpha, sweeps):
+        """One board's embedding after the given number of bottom-up sweeps, from the running sums"""
+        if sweeps == 0:
+            return np.zeros(self.embedding_dim)
+        count = self._board_counts.get(board, 0)
+        direct = self._board_sums[board] / count if count > 0 else np.zeros(self.embedding_dim)
+        sub_boards = self.board_hierarchy.get(board, {}).get("sub_boards", [])
+        if not sub_boards:
+            return direct
+        children = np.mean([self._running_embedding(sub_board, alpha, sweeps - 1) for sub_board in sub_boards], axis=0)
+        return (1 - alpha) * direct + alpha * children
+
+    def _add_board_hierarchy(self, pin_ids, main_names, sub_names):
+        """Add category boards and their edges to the graph in bulk.
+
+        Boards, edges and pin lists keep the order in which a row-by-row walk
+        would first meet them, so the resulting graph is identical.
+        """
+        main_boards = 'board_0_' + main_names
+        sub_boards = 'board_1_' + sub_names
+        n = len(pin_ids)
+
+        # Interleave (main, sub) per row, as in a row-by-row walk
+        board_order = pd.unique(np.column_stack([main_boards, sub_boards]).ravel()) if n else []
+        board_names = dict(zip(main_boards, main_names))
+        board_names.update(zip(sub_boards, sub_names))
+        main_set = set(main_boards)
+        self.graph.add_nodes_from(
+            (board, {'type': 'board', 'level': 0 if board in main_set else 1, 'name': board_names[board]})
+            for board in board_order)
+
+        contains = {'relation': 'contains'}
+        parent = {'relation': 'parent'}
+        sources = np.column_stack([main_boards, sub_boards, main_boards]).ravel()
+        targets = np.column_stack([pin_ids, pin_ids, sub_boards]).ravel()
+        self.graph.add_edges_from(zip(sources, targets, [contains, contains, parent] * n))
+
+        memberships = pd.DataFrame({'main': main_boards, 'sub': sub_boards, 'pin': pin_ids})
+        main_pins = memberships.groupby('main', sort=False)['pin'].agg(list)
+        sub_pins = memberships.groupby('sub', sort=False)['pin'].agg(list)
+        children = memberships.groupby('main', sort=False)['sub'].unique()
+
+        board_hierarchy = {}
+        for board in board_order:
+            if board in main_set:
+                board_hierarchy[board] = {"pins": main_pins[board], "sub_boards": list(children[board]), "level": 0}
+            else:
+                board_hierarchy[board] = {"pins": sub_pins[board], "sub_boards": [], "level": 1}
+        return board_hierarchy
+
     def generate_embeddings(self, alpha=0.5, max_depth=3):
         """Generate embeddings for all boards"""
         logging.info("Generating hierarchical board embeddings...")
 
-        board_names = [n for n in self.graph.nodes() if self.graph.nodes[n].get('type') == 'board']
-        self.board_embeddings = {}
-
-        for board in board_names:
-            self.board_embeddings[board] = self._get_recursive_board_embedding(
-                board, alpha=alpha, max_depth=max_depth)
+        adjacency = self._hierarchy_adjacency()
+        embeddings = _hierarchical_embeddings(adjacency['board_pins'], adjacency['board_children'],
+                                              adjacency['pin_features'], alpha=alpha, max_depth=max_depth)
+        self.board_embeddings = {board: embeddings[i] for i, board in enumerate(adjacency['boards'])}
+        self.embedding_params = {'alpha': alpha, 'max_depth': max_depth}
+        self._board_sums = None
+        self._pin_index = None
 
         logging.info(f"Generated embeddings for {len(self.board_embeddings)} boards")
+        self._build_board_index()
         return self.board_embeddings
 
-    def _get_recursive_board_embedding(self, board_name, alpha=0.5, depth=0, max_depth=2):
-        """Generate recursive board embeddings"""
-        if depth > max_depth or board_name not in self.graph:
-            return np.zeros(self.embedding_dim)
-
-        direct_pins = [node for node in self.graph.successors(board_name)
-                      if self.graph.nodes[node].get('type') == 'pin']
-        sub_boards = [node for node in self.graph.successors(board_name)
-                     if self.graph.nodes[node].get('type') == 'board']
-
-        pin_vectors = [self.graph.nodes[pin]["features"] for pin in direct_pins if pin in self.graph]
-        direct_embedding = np.mean(pin_vectors, axis=0) if pin_vectors else np.zeros(self.embedding_dim)
-
-        if not sub_boards:
-            return direct_embedding
-
-        sub_embeddings = [self._get_recursive_board_embedding(sub, alpha, depth+1, max_depth)
-                         for sub in sub_boards]
-        sub_embedding = np.mean(sub_embeddings, axis=0) if sub_embeddings else np.zeros(self.embedding_dim)
+    def _hierarchy_adjacency(self):
+        """CSR board->pin and board->sub-board adjacency, cached per graph version
+
+        Methods that change the graph bump _graph_version. Code that edits
+        self.graph directly must do the same (or reassign self.graph).
+        """
+        if self._graph is None and self._adjacency is not None:
+            # Loaded model whose graph hasn't been rebuilt: the saved adjacency is current
+            return self._adjacency
+        key = self._graph_version
+        cached = self._adjacency
+        if cached is not None and cached['key'] == key:
+            return cached
+
+        self._adjacency = hierarchy_adjacency(self.graph, self.embedding_dim)
+        self._adjacency['key'] = key
+        return self._adjacency
+
+    def cluster_boards(self, min_clusters=2, max_clusters=10, method='kmeans', silhouette_sample_size=None,
+                       n_jobs=1, patience=None, batch_size=1024):
+        """Cluster boards based on embeddings
+
+        Every k in range is fitted with KMeans (method='kmeans') or
+        MiniBatchKMeans (method='minibatch') and scored by silhouette, on a
+        random sample of silhouette_sample_size boards when given. Fitted
+        models are kept in self.cluster_models so the best k is not refitted.
+        k values are evaluated n_jobs at a time in parallel (None: one per CPU,
+        negative values count back from the CPU count); with patience set,
+        the search stops once that many k values in a row fail to improve on
+        the best score. Per-k fit and scoring times land in self.k_timings.
+        """
+        from joblib import Parallel, delayed
 
-        return (1 - alpha) * direct_embedding + alpha * sub_embedding
-
-    def cluster_boards(self, min_clusters=2, max_clusters=10):
-        """Cluster boards based on embeddings"""
         logging.info("Clustering boards...")
 
         board_names = list(self.board_embeddings.keys())
         if len(board_names) < min_clusters:
             logging.warning(f"Not enough boards ({len(board_names)}) for clustering")
             return np.zeros(len(board_names)), board_names
+        if method not in ('kmeans', 'minibatch'):
+            raise ValueError(f"Unknown clustering method '{method}', expected 'kmeans' or 'minibatch'")
 
         embeddings_array = np.array([self.board_embeddings[name] for name in board_names])
 
-        k_range = range(min_clusters, min(max_clusters + 1, len(board_names)))
-        silhouette_scores = []
-
-        for k in k_range:
-            kmeans = KMeans(n_clusters=k, random_state=self.random_seed, n_init=10)
-            labels = kmeans.fit_predict(embeddings_array)
-            score = silhouette_score(embeddings_array, labels)
-            silhouette_scores.append(score)
+        candidate_ks = list(range(min_clusters, min(max_clusters + 1, len(board_names))))
+        cpu_count = os.cpu_count() or 1
+        if n_jobs is None:
+            n_jobs = cpu_count
+        n_parallel = max(1, cpu_count + 1 + n_jobs if n_jobs < 0 else n_jobs)
+        cluster_models, silhouette_scores, k_timings, k_range = {}, [], {}, []
+        best_score, since_best = -np.inf, 0
+
+        for start in range(0, len(candidate_ks), n_parallel):
+            round_ks = candidate_ks[start:start + n_parallel]
+            fits = Parallel(n_jobs=min(n_parallel, len(round_ks)))(
+                delayed(_evaluate_k)(embeddings_array, k, method, self.random_seed, batch_size,
+                                     silhouette_sample_size)
+                for k in round_ks)
+            for k, (model, score, seconds) in zip(round_ks, fits):
+                logging.info(f"k={k}: silhouette {score:.4f} in {seconds:.2f}s")
+                cluster_models[k] = model
+                silhouette_scores.append(score)
+                k_timings[k] = seconds
+                k_range.append(k)
+                if score > best_score:
+                    best_score, since_best = score, 0
+                else:
+                    since_best += 1
+            if patience is not None and since_best >= patience:
+                logging.info(f"No silhouette improvement for {since_best} k values, stopping at k={k_range[-1]}")
+                break
 
         optimal_k = k_range[np.argmax(silhouette_scores)] if silhouette_scores else min_clusters
+        if optimal_k not in cluster_models:
+            cluster_models[optimal_k] = _fit_cluster_model(embeddings_array, optimal_k, method, self.random_seed,
+                                                           batch_size)
+        clusters = cluster_models[optimal_k].labels_
         logging.info(f"Optimal number of clusters: {optimal_k}")
 
-        kmeans = KMeans(n_clusters=optimal_k, random_state=self.random_seed, n_init=10)
-        clusters = kmeans.fit_predict(embeddings_array)
-
         self.board_names = board_names
         self.embeddings_array = embeddings_array
         self.clusters = clusters
         self.optimal_k = optimal_k
         self.silhouette_scores = silhouette_scores
         self.k_range = k_range
+        self.k_timings = k_timings
+        self.cluster_models = cluster_models
+        self._build_board_index()
 
         return clusters, board_names
 
-    def visualize(self, output_file='pinsage_real_data_visualization.png'):
-        """Create visualizations for the model"""
+    def visualize(self, output_file='pinsage_real_data_visualization.png', sample_size=None, projection='tsne',
+                  pca_components=50, show=True, dpi=300, panel_dir=None, json_file=None):
+        """Create visualizations for the model
+
+        By default this draws the six-panel figure to output_file and shows
+        it. For large models and headless runs:
+
+        sample_size   project and plot a random sample of boards
+        projection    'tsne' (after a PCA down to pca_components dimensions)
+                      or 'pca' (a straight 2-D PCA, much faster)
+        show=False    skip plt.show() and close the figures
+        panel_dir     write each panel as its own image instead of one figure
+        json_file     also write the panel data (see visualization_data)
+
+        Per-panel compute and draw times are logged and kept in
+        self.visualization_timings.
+        """
+        import matplotlib.pyplot as plt
+
         logging.info("Creating visualizations...")
 
         if not self.board_names or len(self.board_names) < 2:
             logging.warning("Not enough boards to visualize")
             return
 
-        plt.figure(figsize=(20, 16))
+        data = self.visualization_data(sample_size=sample_size, projection=projection,
+                                       pca_components=pca_components)
+        timings = data['timings']
 
-        # t-SNE embedding
-        perplexity_value = min(5, len(self.board_names) - 1) if len(self.board_names) > 1 else 1
-        try:
-            tsne = TSNE(n_components=2, random_state=self.random_seed, perplexity=perplexity_value)
-            embeddings_2d = tsne.fit_transform(self.embeddings_array)
-        except Exception as e:
-            logging.warning(f"t-SNE failed: {e}, skipping 2D embedding plots")
-            embeddings_2d = np.zeros((len(self.board_names), 2))
+        if panel_dir is not None:
+            os.makedirs(panel_dir, exist_ok=True)
+        else:
+            plt.figure(figsize=(20, 16))
 
-        # 1. Silhouette score plot
-        plt.subplot(2, 3, 1)
-        if self.silhouette_scores:
-            plt.plot(list(self.k_range), self.silhouette_scores, marker='o')
+        for position, panel in enumerate(VISUALIZATION_PANELS, start=1):
+            start = time.perf_counter()
+            if panel_dir is not None:
+                plt.figure(figsize=(8, 6))
+            else:
+                plt.subplot(2, 3, position)
+            getattr(self, f'_draw_{panel}_panel')(data[panel])
+            if panel_dir is not None:
+                plt.tight_layout()
+                plt.savefig(os.path.join(panel_dir, f'{panel}.png'), dpi=dpi, bbox_inches='tight')
+                plt.close()
+            timings[panel] += time.perf_counter() - start
+
+        if panel_dir is None:
+            start = time.perf_counter()
+            plt.tight_layout()
+            plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
+            timings['figure'] = time.perf_counter() - start
+            if show:
+                plt.show()
+            else:
+                plt.close()
+
+        if json_file is not None:
+            with open(json_file, 'w') as f:
+                json.dump(data, f)
+
+        for panel, seconds in timings.items():
+            logging.info(f"Visualization panel {panel}: {seconds:.2f}s")
+        self.visualization_timings = timings
+
+    def visualization_data(self, sample_size=None, projection='tsne', pca_components=50, max_labels=30,
+                           max_boards=50, max_heatmap_size=20):
+        """JSON-ready data behind each visualize() panel, with per-panel compute times"""
+        timings = {}
+        names = list(self.board_names)
+        level_of = self._board_level_map()
+        levels = [level_of.get(board, 0) for board in names]
+
+        start = time.perf_counter()
+        silhouette = {'k': [int(k) for k in self.k_range], 'scores': [float(score) for score in self.silhouette_scores]}
+        timings['silhouette'] = time.perf_counter() - start
+
+        # 2-D projection of a sample of boards, shared by the cluster and level panels
+        start = time.perf_counter()
+        sample = np.arange(len(names))
+        if sample_size is not None and sample_size < len(names):
+            rng = np.random.default_rng(self.random_seed)
+            sample = np.sort(rng.choice(len(names), size=sample_size, replace=False))
+        embeddings_2d = _project_2d(np.asarray(self.embeddings_array)[sample], projection, pca_components,
+                                    self.random_seed)
+        label_positions = np.round(np.linspace(0, len(sample) - 1, max_labels)).astype(int) \
+            if len(sample) > max_labels else np.arange(len(sample))
+        scatter = {
+            'boards': [names[i] for i in sample],
+            'x': embeddings_2d[:, 0].tolist(),
+            'y': embeddings_2d[:, 1].tolist(),
+            'clusters': np.asarray(self.clusters)[sample].tolist(),
+            'levels': [levels[i] for i in sample],
+            'labels': label_positions.tolist()
+        }
+        timings['clusters'] = time.perf_counter() - start
+        timings['levels'] = 0.0
+
+        # A few boards per level and the parent edges between them
+        start = time.perf_counter()
+        if len(names) > max_boards:
+            by_level = {}
+            for board, level in zip(names, levels):
+                by_level.setdefault(level, []).append(board)
+            selected_boards = [board for boards in by_level.values() for board in boards[:min(5, len(boards))]]
+        else:
+            selected_boards = names
+        adjacency = self._hierarchy_adjacency()
+        rows = {board: i for i, board in enumerate(adjacency['boards'])}
+        selected = set(selected_boards)
+        board_children = adjacency['board_children']
+        edges = [[board, adjacency['boards'][child]] for board in selected_boards if board in rows
+                 for child in board_children.indices[board_children.indptr[rows[board]]:board_children.indptr[rows[board] + 1]]
+                 if adjacency['boards'][child] in selected]
+        hierarchy = {'boards': selected_boards, 'levels': [level_of.get(board, 0) for board in selected_boards],
+                     'edges': edges}
+        timings['hierarchy'] = time.perf_counter() - start
+
+        # Cosine similarities of evenly spaced boards, as one normalized matrix product
+        start = time.perf_counter()
+        heatmap_positions = np.round(np.linspace(0, len(names) - 1, max_heatmap_size)).astype(int) \
+            if len(names) > max_heatmap_size else np.arange(len(names))
+        heatmap_boards = [names[i] for i in heatmap_positions]
+        matrix = np.array([self.board_embeddings[board] for board in heatmap_boards], dtype=float)
+        normalized = l2_normalize(matrix)
+        similarity = {'boards': heatmap_boards, 'matrix': (normalized @ normalized.T).tolist()}
+        timings['similarity'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        counts = pd.DataFrame({'level': levels, 'cluster': np.asarray(self.clusters)}).value_counts(sort=False)
+        level_clusters = [{'level': int(level), 'cluster': int(cluster), 'count': int(count)}
+                          for (level, cluster), count in counts.items()]
+        timings['level_clusters'] = time.perf_counter() - start
+
+        return {
+            'silhouette': silhouette,
+            'clusters': scatter,
+            'levels': scatter,
+            'hierarchy': hierarchy,
+            'similarity': similarity,
+            'level_clusters': level_clusters,
+            'timings': timings
+        }
+
+    def _board_level_map(self):
+        """Level of every board, without rebuilding the graph of a loaded model"""
+        if self._graph is None and self._adjacency is not None:
+            return dict(zip(self._adjacency['boards'], self._board_levels))
+        return {board: level for board, level in self.graph.nodes(data='level') if level is not None}
+
+    def _draw_silhouette_panel(self, data):
+        import matplotlib.pyplot as plt
+
+        if data['scores']:
+            plt.plot(data['k'], data['scores'], marker='o')
             plt.title('Silhouette Score for Different Cluster Counts')
             plt.xlabel('Number of Clusters (k)')
             plt.ylabel('Silhouette Score')
@@ -319,62 +848,29 @@ class PinSageHierarchical:
         else:
             plt.text(0.5, 0.5, "No silhouette scores available", ha='center', va='center')
 
-        # 2. Board embeddings by cluster
-        plt.subplot(2, 3, 2)
-        scatter = plt.scatter(embeddings_2d[:, 0], embeddings_2d[:, 1],
-                           c=self.clusters, cmap='tab10', s=100, alpha=0.7)
-
-        max_labels = 30
-        if len(self.board_names) > max_labels:
-            indices = np.round(np.linspace(0, len(self.board_names) - 1, max_labels)).astype(int)
-        else:
-            indices = range(len(self.board_names))
-
-        for i in indices:
-            plt.annotate(self._short_name(self.board_names[i]),
-                        (embeddings_2d[i, 0], embeddings_2d[i, 1]), fontsize=8)
+    def _draw_scatter(self, data, colors, cmap, title, label):
+        import matplotlib.pyplot as plt
 
-        plt.title('Board Embeddings by Cluster')
-        plt.colorbar(scatter, label='Cluster')
+        scatter = plt.scatter(data['x'], data['y'], c=colors, cmap=cmap, s=100, alpha=0.7)
+        for i in data['labels']:
+            plt.annotate(self._short_name(data['boards'][i]), (data['x'][i], data['y'][i]), fontsize=8)
+        plt.title(title)
+        plt.colorbar(scatter, label=label)
 
-        # 3. Board embeddings by hierarchy level
-        plt.subplot(2, 3, 3)
-        levels = [self.graph.nodes[board].get('level', 0) for board in self.board_names]
-        scatter_levels = plt.scatter(embeddings_2d[:, 0], embeddings_2d[:, 1],
-                                  c=levels, cmap='viridis', s=100, alpha=0.7)
+    def _draw_clusters_panel(self, data):
+        self._draw_scatter(data, data['clusters'], 'tab10', 'Board Embeddings by Cluster', 'Cluster')
 
-        for i in indices:
-            plt.annotate(self._short_name(self.board_names[i]),
-                        (embeddings_2d[i, 0], embeddings_2d[i, 1]), fontsize=8)
+    def _draw_levels_panel(self, data):
+        self._draw_scatter(data, data['levels'], 'viridis', 'Board Embeddings by Hierarchy Level', 'Level')
 
-        plt.title('Board Embeddings by Hierarchy Level')
-        plt.colorbar(scatter_levels, label='Level')
+    def _draw_hierarchy_panel(self, data):
+        import matplotlib.pyplot as plt
+        import networkx as nx
 
-        # 4. Hierarchical structure
-        plt.subplot(2, 3, 4)
         G_hierarchy = nx.DiGraph()
-        max_boards = 50
-        if len(self.board_names) > max_boards:
-            levels_dict = {}
-            for board in self.board_names:
-                level = self.graph.nodes[board].get('level', 0)
-                if level not in levels_dict:
-                    levels_dict[level] = []
-                levels_dict[level].append(board)
-
-            selected_boards = []
-            for level, boards in levels_dict.items():
-                selected_boards.extend(boards[:min(5, len(boards))])
-        else:
-            selected_boards = self.board_names
-
-        for board in selected_boards:
-            G_hierarchy.add_node(board, level=self.graph.nodes[board].get('level', 0))
-
-        for board in selected_boards:
-            for successor in self.graph.successors(board):
-                if successor in selected_boards and self.graph.nodes[successor].get('type') == 'board':
-                    G_hierarchy.add_edge(board, successor)
+        for board, level in zip(data['boards'], data['levels']):
+            G_hierarchy.add_node(board, level=level)
+        G_hierarchy.add_edges_from(data['edges'])
 
         if G_hierarchy.nodes():
             pos = nx.multipartite_layout(G_hierarchy, subset_key='level', align='horizontal')
@@ -392,53 +888,23 @@ class PinSageHierarchical:
         plt.title('Board Hierarchy (Sample)')
         plt.axis('off')
 
-        # 5. Board similarity heatmap
-        plt.subplot(2, 3, 5)
-        max_heatmap_size = 20
-        if len(self.board_names) > max_heatmap_size:
-            indices = np.round(np.linspace(0, len(self.board_names) - 1, max_heatmap_size)).astype(int)
-            heatmap_boards = [self.board_names[i] for i in indices]
-        else:
-            heatmap_boards = self.board_names
-            indices = range(len(self.board_names))
-
-        similarity_matrix = np.zeros((len(heatmap_boards), len(heatmap_boards)))
-        for i, board1 in enumerate(heatmap_boards):
-            for j, board2 in enumerate(heatmap_boards):
-                emb1 = self.board_embeddings[board1]
-                emb2 = self.board_embeddings[board2]
-                norm1 = np.linalg.norm(emb1)
-                norm2 = np.linalg.norm(emb2)
-                similarity = np.dot(emb1, emb2) / (norm1 * norm2) if norm1 > 0 and norm2 > 0 else 0
-                similarity_matrix[i, j] = similarity
-
-        sns.heatmap(similarity_matrix, annot=False,
-                   xticklabels=[self._short_name(b) for b in heatmap_boards],
-                   yticklabels=[self._short_name(b) for b in heatmap_boards],
-                   cmap='YlGnBu')
+    def _draw_similarity_panel(self, data):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
+        labels = [self._short_name(b) for b in data['boards']]
+        sns.heatmap(np.array(data['matrix']), annot=False, xticklabels=labels, yticklabels=labels, cmap='YlGnBu')
         plt.xticks(rotation=90, fontsize=8)
         plt.yticks(fontsize=8)
         plt.title('Board Similarity Heatmap (Sample)')
 
-        # 6. Cluster distribution by level
-        plt.subplot(2, 3, 6)
-        level_cluster_counts = {}
-        for i, board in enumerate(self.board_names):
-            level = self.graph.nodes[board].get('level', 0)
-            cluster = self.clusters[i]
-            if level not in level_cluster_counts:
-                level_cluster_counts[level] = {}
-            if cluster not in level_cluster_counts[level]:
-                level_cluster_counts[level][cluster] = 0
-            level_cluster_counts[level][cluster] += 1
-
-        level_data = []
-        for level, clusters in level_cluster_counts.items():
-            for cluster, count in clusters.items():
-                level_data.append({'Level': level, 'Cluster': f'Cluster {cluster}', 'Count': count})
-
-        if level_data and len(level_data) > 1:
-            df_levels = pd.DataFrame(level_data)
+    def _draw_level_clusters_panel(self, data):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
+        if data and len(data) > 1:
+            df_levels = pd.DataFrame([{'Level': row['level'], 'Cluster': f"Cluster {row['cluster']}",
+                                       'Count': row['count']} for row in data])
             pivot_table = df_levels.pivot_table(index='Level', columns='Cluster',
                                              values='Count', fill_value=0)
             sns.heatmap(pivot_table, annot=True, fmt='.1f', cmap='Blues')
@@ -447,10 +913,6 @@ class PinSageHierarchical:
             plt.text(0.5, 0.5, "Insufficient data for level-cluster distribution",
                     ha='center', va='center')
 
-        plt.tight_layout()
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
-        plt.show()
-
     def _short_name(self, name, max_length=15):
         """Create shorter board name for visualization"""
         if len(name) <= max_length:
@@ -458,131 +920,229 @@ class PinSageHierarchical:
         parts = name.split('_', 2)
         return parts[2][:max_length] if len(parts) > 2 else name[:max_length]
 
+    def _build_board_index(self):
+        """Cache an L2-normalized board embedding matrix for similarity queries"""
+        names = list(self.board_embeddings.keys())
+        matrix = np.array([self.board_embeddings[name] for name in names], dtype=float)
+        adjacency = self._hierarchy_adjacency()
+        board_children = adjacency['board_children']
+        children = child_positions(names, adjacency['boards'], board_children.indptr, board_children.indices)
+        self._board_index = BoardIndex(names, matrix.reshape(len(names), self.embedding_dim), children,
+                                       **self._board_quantization)
+
+    def quantize_boards(self, quantization='int8', rerank=4, **codec_params):
+        """Serve recommend_similar_boards from quantized board codes ('float16', 'int8' or 'pq')
+
+        Candidates are shortlisted on the codes and the best rerank * top_k
+        are re-ranked on the exact embeddings. quantization=None goes back
+        to the exact matrix.
+        """
+        self._board_quantization = {'quantization': quantization, 'rerank': rerank, **codec_params}
+        if self.board_embeddings:
+            self._build_board_index()
+
+    def _ensure_board_index(self):
+        if getattr(self, '_board_index', None) is None or len(self._board_index) != len(self.board_embeddings):
+            self._build_board_index()
+
     def recommend_similar_boards(self, query_board, top_k=5, exclude_children=False):
         """Recommend similar boards based on embeddings"""
         if query_board not in self.board_embeddings:
             raise ValueError(f"Board '{query_board}' not found in embeddings")
 
-        query_emb = self.board_embeddings[query_board]
-        norm_query = np.linalg.norm(query_emb)
-        if norm_query == 0:
-            return []
-
-        similarities = []
-        for board in self.board_names:
-            if board == query_board:
-                continue
-            if exclude_children and self.graph.has_edge(query_board, board):
-                continue
-            emb = self.board_embeddings[board]
-            norm_board = np.linalg.norm(emb)
-            if norm_board > 0:
-                sim = np.dot(query_emb, emb) / (norm_query * norm_board)
-                similarities.append((board, sim))
-
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:top_k]
-
-    def evaluate_recommendations(self, test_data, k_values=[1, 3, 5, 10], alpha=0.6, max_depth=3):
-        """Evaluate recommendation performance"""
-        logging.info("Evaluating recommendation performance...")
-
-        if not self.board_embeddings:
-            self.generate_embeddings(alpha=alpha, max_depth=max_depth)
-
-        results = {metric: {k: [] for k in k_values} for metric in ['accuracy', 'hit_ratio', 'mrr', 'ndcg']}
-
-        user_interactions = test_data.groupby('user_id')
-
-        for user_id, interactions in user_interactions:
-            user_boards = self._get_user_boards(user_id, interactions)
-            if not user_boards:
-                continue
-
-            test_pins = set(interactions['pin_id'].astype(str).apply(lambda x: f"pin_{x}"))
-            test_boards = set()
-            for pin_id in test_pins:
-                if pin_id in self.graph:
-                    boards = [n for n in self.graph.predecessors(pin_id)
-                             if self.graph.nodes[n].get('type') == 'board']
-                    test_boards.update(boards)
-
-            if not test_boards:
-                continue
-
-            all_recommendations = []
-            for query_board in user_boards:
-                if query_board in self.board_embeddings:
-                    recommendations = self.recommend_similar_boards(query_board, top_k=max(k_values))
-                    all_recommendations.extend(recommendations)
-
-            recommended_boards = {}
-            for board, sim in all_recommendations:
-                if board not in recommended_boards or sim > recommended_boards[board]:
-                    recommended_boards[board] = sim
-
-            sorted_recommendations = sorted(recommended_boards.items(), key=lambda x: x[1], reverse=True)
-
-            for k in k_values:
-                top_k_recommendations = [board for board, _ in sorted_recommendations[:k]]
-                hits = len(set(top_k_recommendations) & test_boards)
-
-                results['hit_ratio'][k].append(hits / len(test_boards) if test_boards else 0)
-                results['accuracy'][k].append(hits / k if k > 0 else 0)
+        self._ensure_board_index()
+        return self._board_index.recommend(query_board, top_k, exclude_children)
+
+    def recommend_similar_boards_many(self, query_boards, top_k=5, exclude_children=False):
+        """Recommend similar boards for many query boards with a single matrix product"""
+        missing = [board for board in query_boards if board not in self.board_embeddings]
+        if missing:
+            raise ValueError(f"Board '{missing[0]}' not found in embeddings")
+
+        self._ensure_board_index()
+        return self._board_index.recommend_many(query_boards, top_k, exclude_children)
+
+    def _build_pin_index(self):
+        """IVF index over pin features whose lists are the leaf (sub-category) boards"""
+        adjacency = self._hierarchy_adjacency()
+        boards, board_pins = adjacency['boards'], adjacency['board_pins']
+        leaves = np.flatnonzero(np.diff(adjacency['board_children'].indptr) == 0)
+        leaf_pins = board_pins[leaves]
+        vectors = normalize_rows(adjacency['pin_features'])
+
+        # Lists are probed by board embedding; leaves without one fall back to their mean pin
+        counts = np.maximum(np.asarray(leaf_pins.sum(axis=1)).ravel(), 1)
+        centroids = (leaf_pins @ np.asarray(adjacency['pin_features'], dtype=float)) / counts[:, None]
+        for i, leaf in enumerate(leaves):
+            if boards[leaf] in self.board_embeddings:
+                centroids[i] = self.board_embeddings[boards[leaf]]
+        centroids = normalize_rows(centroids)
+
+        # Each pin goes in its first leaf board, or the closest list if it sits in none
+        pin_leaves = leaf_pins.tocsc()
+        pin_leaves.sort_indices()
+        in_leaf = np.diff(pin_leaves.indptr) > 0
+        assignments = np.full(len(vectors), -1, dtype=np.int64)
+        assignments[in_leaf] = pin_leaves.indices[pin_leaves.indptr[:-1][in_leaf]]
+        if not in_leaf.all():
+            assignments[~in_leaf] = assign_to_centroids(vectors[~in_leaf], centroids)
+
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(len(leaves) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=len(leaves)), out=offsets[1:])
+        self._pin_index = IVFIndex(centroids, vectors[order], order, offsets)
+        self._pin_rows = np.empty_like(order)
+        self._pin_rows[order] = np.arange(len(order))
+        self._pin_positions = {pin: i for i, pin in enumerate(adjacency['pins'])}
+        self._pin_names = adjacency['pins']
+
+    def _ensure_pin_index(self):
+        if self._pin_index is None:
+            self._build_pin_index()
+
+    def recommend_similar_pins(self, pin_id, top_k=5, n_probe=3):
+        """Recommend similar pins (products) to pin_id, e.g. 'pin_42'
+
+        Only the pins of the n_probe sub-category boards whose embeddings are
+        closest to the query pin are ranked. n_probe equal to the number of
+        sub-category boards is an exact search; evaluate_pin_recall shows
+        what smaller values give up.
+        """
+        self._ensure_pin_index()
+        if pin_id not in self._pin_positions:
+            raise ValueError(f"Pin '{pin_id}' not found")
+
+        position = self._pin_positions[pin_id]
+        query = self._pin_index.vectors[self._pin_rows[position]]
+        ids, scores = self._pin_index.search(query, top_k + 1, n_probe)
+        return [(str(self._pin_names[i]), float(score)) for i, score in zip(ids.tolist(), scores) if i != position][:top_k]
+
+    def evaluate_pin_recall(self, n_probe_values=(1, 2, 4, 8), top_k=10, n_queries=200):
+        """Recall@top_k and latency of recommend_similar_pins against a brute-force scan
+
+        Returns {'brute_force': {'ms_per_query'}, 'n_probe': {n_probe: {'recall',
+        'ms_per_query'}}} over n_queries randomly sampled query pins.
+        """
+        self._ensure_pin_index()
+        index = self._pin_index
+        rng = np.random.default_rng(self.random_seed)
+        queries = rng.choice(len(self._pin_names), size=min(n_queries, len(self._pin_names)), replace=False)
+
+        start = time.perf_counter()
+        exact = []
+        for position in queries:
+            query = index.vectors[self._pin_rows[position]]
+            scores = index.vectors @ query
+            scores[self._pin_rows[position]] = -np.inf
+            ranked, _ = rank_rows(scores[None], top_k)
+            exact.append(set(index.ids[ranked[0]].tolist()))
+        results = {'brute_force': {'ms_per_query': 1000 * (time.perf_counter() - start) / len(queries)},
+                   'n_probe': {}}
+
+        for n_probe in n_probe_values:
+            start = time.perf_counter()
+            found = [self.recommend_similar_pins(self._pin_names[position], top_k, n_probe) for position in queries]
+            seconds = time.perf_counter() - start
+            recall = np.mean([len({self._pin_positions[pin] for pin, _ in pins} & truth) / max(len(truth), 1)
+                              for pins, truth in zip(found, exact)])
+            results['n_probe'][n_probe] = {'recall': float(recall), 'ms_per_query': 1000 * seconds / len(queries)}
+            logging.info(f"n_probe={n_probe}: recall@{top_k} {recall:.3f}, "
+                         f"{results['n_probe'][n_probe]['ms_per_query']:.2f} ms/query "
+                         f"(brute force {results['brute_force']['ms_per_query']:.2f} ms)")
+        return results
 
-                mrr = 0
-                for i, (board, _) in enumerate(sorted_recommendations[:k]):
-                    if board in test_boards:
-                        mrr = 1.0 / (i + 1)
-                        break
-                results['mrr'][k].append(mrr)
+    def evaluate_recommendations(self, test_data, k_values=[1, 3, 5, 10], alpha=0.6, max_depth=3, chunk_size=10000,
+                                 history=None):
+        """Evaluate recommendation performance
 
-                dcg = 0
-                idcg = sum(1.0 / np.log2(i + 2) for i in range(min(len(test_boards), k)))
-                for i, (board, _) in enumerate(sorted_recommendations[:k]):
-                    if board in test_boards:
-                        dcg += 1.0 / np.log2(i + 2)
-                results['ndcg'][k].append(dcg / idcg if idcg > 0 else 0)
+        All users are scored together: board neighbours come from one batched
+        similarity product, each user's boards and relevant boards are rows of
+        a sparse users x boards matrix, and precision (accuracy), recall (hit
+        ratio), MRR and NDCG for every k are read off one ranked hit matrix.
+        Users are processed chunk_size at a time to bound memory.
 
-        for metric in results:
-            for k in k_values:
-                results[metric][k] = np.mean(results[metric][k]) if results[metric][k] else 0
+        By default a user's query boards and relevant boards both come from
+        test_data. If history is given, queries come from the user's history
+        interactions and test_data only supplies the relevant boards.
+        """
+        logging.info("Evaluating recommendation performance...")
 
-        return results
+        if not self.board_embeddings:
+            self.generate_embeddings(alpha=alpha, max_depth=max_depth)
+        self._ensure_board_index()
+
+        adjacency = self._hierarchy_adjacency()
+        pins = pd.Index(adjacency['pins'])
+        users = pd.Index(pd.unique(test_data['user_id']))
+        relevant_boards = _user_board_matrix(*_interaction_positions(test_data, users, pins), len(users),
+                                             adjacency['board_pins'])
+        query_boards = relevant_boards if history is None else _user_board_matrix(
+            *_interaction_positions(history, users, pins), len(users), adjacency['board_pins'])
+
+        # Boards outside the embedding index still count as relevant but can't be queried or hit
+        index = self._board_index
+        index_positions = np.array([index.positions.get(board, -1) for board in adjacency['boards']],
+                                   dtype=np.int64)
+        neighbours, neighbour_scores = board_neighbours(index.vectors(), index.valid, max(k_values))
+        totals, n_users = _score_users(query_boards, relevant_boards, index_positions, neighbours, neighbour_scores,
+                                       len(index), k_values, chunk_size)
+        return _average_metrics(totals, n_users)
+
+    def cross_validate(self, interaction_data, n_folds=5, k_values=[1, 3, 5, 10], alpha=0.6, max_depth=3,
+                       n_jobs=None):
+        """Perform cross-validation
+
+        Every fold retrains the board embeddings on its train split: a pin's
+        weight in its boards' means is 1 plus its number of train
+        interactions. Each test user is then queried from the boards of their
+        train interactions and scored against the boards of their test ones.
+
+        Folds run in a pool of n_jobs processes (default: one per fold, up to
+        the CPU count). The pin feature matrix is placed in shared memory once
+        instead of being pickled to every worker.
+        """
+        from sklearn.model_selection import KFold
 
-    def _get_user_boards(self, user_id, interactions):
-        """Get boards associated with a user based on their interactions"""
-        # Simulate user boards based on interacted pins
-        user_pins = set(interactions['pin_id'].astype(str).apply(lambda x: f"pin_{x}"))
-        user_boards = set()
-        for pin in user_pins:
-            if pin in self.graph:
-                boards = [n for n in self.graph.predecessors(pin)
-                         if self.graph.nodes[n].get('type') == 'board']
-                user_boards.update(boards)
-        return list(user_boards)
-
-    def cross_validate(self, interaction_data, n_folds=5, k_values=[1, 3, 5, 10]):
-        """Perform cross-validation"""
         logging.info(f"Performing {n_folds}-fold cross-validation...")
 
-        cv_results = {metric: {k: [] for k in k_values} for metric in ['accuracy', 'hit_ratio', 'mrr', 'ndcg']}
+        adjacency = self._hierarchy_adjacency()
+        users = pd.Index(pd.unique(interaction_data['user_id']))
+        user_codes, pin_positions = _interaction_positions(interaction_data, users, pd.Index(adjacency['pins']))
         kf = KFold(n_splits=n_folds, shuffle=True, random_state=self.random_seed)
+        folds = [(user_codes[train_idx], pin_positions[train_idx], user_codes[test_idx], pin_positions[test_idx])
+                 for train_idx, test_idx in kf.split(interaction_data)]
+        fold_args = (len(users), alpha, max_depth, k_values)
+
+        if n_jobs is None:
+            n_jobs = min(n_folds, os.cpu_count() or 1)
+
+        pin_features = np.ascontiguousarray(adjacency['pin_features'], dtype=float)
+        if n_jobs == 1:
+            _fold_state.update(pin_features=pin_features, board_pins=adjacency['board_pins'],
+                               board_children=adjacency['board_children'])
+            try:
+                fold_results = [_run_fold(fold, *fold_args) for fold in folds]
+            finally:
+                _fold_state.clear()
+        else:
+            shared = shared_memory.SharedMemory(create=True, size=max(pin_features.nbytes, 1))
+            try:
+                np.ndarray(pin_features.shape, dtype=float, buffer=shared.buf)[:] = pin_features
+                with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_fold_worker,
+                                         initargs=(shared.name, pin_features.shape, adjacency['board_pins'],
+                                                   adjacency['board_children'])) as executor:
+                    fold_results = list(executor.map(_run_fold, folds, *zip(*[fold_args] * len(folds))))
+            finally:
+                shared.close()
+                shared.unlink()
 
-        for fold, (train_idx, test_idx) in enumerate(kf.split(interaction_data)):
-            logging.info(f"Processing fold {fold+1}/{n_folds}")
-
-            train_data = interaction_data.iloc[train_idx]
-            test_data = interaction_data.iloc[test_idx]
-
-            # Note: In a real implementation, rebuild graph with train_data
-            # For simplicity, we use the existing graph
-            self.generate_embeddings(alpha=0.6, max_depth=3)
-            fold_results = self.evaluate_recommendations(test_data, k_values=k_values)
-
+        cv_results = {metric: {k: [] for k in k_values} for metric in ['accuracy', 'hit_ratio', 'mrr', 'ndcg']}
+        for fold, results in enumerate(fold_results):
+            logging.info(f"Fold {fold+1}/{n_folds}: hit ratio@{max(k_values)} = "
+                         f"{results['hit_ratio'][max(k_values)]:.4f}")
             for metric in cv_results:
                 for k in k_values:
-                    cv_results[metric][k].append(fold_results[metric][k])
+                    cv_results[metric][k].append(results[metric][k])
 
         final_results = {}
         for metric in cv_results:
@@ -596,8 +1156,449 @@ class PinSageHierarchical:
 
         return final_results
 
+class ProductRecommender:
+    """Similar, trending and per-category product lookups for the shop dashboard
+
+    Built once from a product export of the shop catalog (a DataFrame, a list
+    of product dicts, or a CSV/JSON file such as a mongoexport --jsonArray
+    dump) with price, rating, numReviews, countInStock and category fields.
+    fit() standardizes and L2-normalizes the numeric features and stores the
+    top_k most cosine-similar products of every product, so
+    get_similar_products is a row slice of that table. Trending scores
+    (sales_weight * sales + rating_weight * rating, each scaled to [0, 1] by
+    the catalog maximum) live in a max-heap that update_product keeps current.
+
+    The catalog has no sales counter of its own, so sales_col defaults to
+    numReviews; pass a column of order quantities as sales_col when the
+    export has one.
+    """
+
+    def __init__(self, products=None, top_k=10, feature_cols=PRODUCT_FEATURE_COLUMNS, sales_col='numReviews',
+                 sales_weight=0.7, rating_weight=0.3, chunk_size=4096):
+        self.top_k = top_k
+        self.feature_cols = list(feature_cols)
+        self.sales_col = sales_col
+        self.sales_weight = sales_weight
+        self.rating_weight = rating_weight
+        self.chunk_size = chunk_size
+        self.fit(products if products is not None else pd.DataFrame())
+
+    def fit(self, products):
+        """Build the neighbour table, trending heap and category counts from a product export"""
+        start = time.perf_counter()
+        df = _read_products(products)
+        id_col = '_id' if '_id' in df.columns else 'product_id'
+        self.product_ids = [_export_value(value) for value in df[id_col]] if id_col in df.columns else []
+        self.positions = {product_id: i for i, product_id in enumerate(self.product_ids)}
+        if len(self.positions) != len(self.product_ids):
+            raise ValueError(f"Duplicate product ids in the '{id_col}' column")
+
+        n_products = len(self.product_ids)
+        columns = {col: pd.to_numeric(df[col], errors='coerce') if col in df.columns
+                   else pd.Series(np.nan, index=df.index) for col in set(self.feature_cols) | {self.sales_col, 'rating'}}
+        self.categories = [_export_value(value) for value in df['category']] if 'category' in df.columns \
+            else [None] * n_products
+        self.names = df['name'].tolist() if 'name' in df.columns else [None] * n_products
+
+        # Standardize, then L2-normalize so a dot product is the cosine similarity
+        features = np.column_stack([columns[col].to_numpy(dtype=float) for col in self.feature_cols]) \
+            if n_products else np.zeros((0, len(self.feature_cols)))
+        means = np.nanmean(features, axis=0) if n_products else np.zeros(len(self.feature_cols))
+        stds = np.nanstd(features, axis=0) if n_products else np.ones(len(self.feature_cols))
+        features = np.nan_to_num((features - means) / np.where(stds > 0, stds, 1))
+        self.features = l2_normalize(features)
+        self.valid = self.features.any(axis=1)
+        self.neighbours, self.neighbour_scores = board_neighbours(self.features, self.valid, self.top_k,
+                                                                  self.chunk_size)
+
+        self.sales = np.nan_to_num(columns[self.sales_col].to_numpy(dtype=float))
+        self.ratings = np.nan_to_num(columns['rating'].to_numpy(dtype=float))
+        self.max_sales, self.max_rating = self._trending_maxima()
+        self._rebuild_trending()
+
+        counts = pd.Series(self.categories, dtype=object).value_counts()
+        self.category_counts = {category: int(count) for category, count in counts.items()}
+
+        logging.info(f"Indexed {n_products} products in {time.perf_counter() - start:.2f}s")
+        return self
+
+    def _trending_maxima(self):
+        if not len(self.sales):
+            return 1.0, 1.0
+        return max(float(self.sales.max()), 1.0), max(float(self.ratings.max()), 1.0)
+
+    def _trending_score(self, sales, ratings):
+        return self.sales_weight * sales / self.max_sales + self.rating_weight * ratings / self.max_rating
+
+    def _rebuild_trending(self):
+        """Score every product and heapify the scores"""
+        self.trending_scores = self._trending_score(self.sales, self.ratings)
+        # Max-heap of (-score, position); update_product pushes fresh entries and stale ones are skipped
+        self._trending_heap = [(-score, position) for position, score in enumerate(self.trending_scores.tolist())]
+        heapq.heapify(self._trending_heap)
+
+    def _product(self, position, **fields):
+        return {
+            'product_id': self.product_ids[position],
+            'name': self.names[position],
+            'category': self.categories[position],
+            **fields
+        }
+
+    def get_similar_products(self, product_id, n=5):
+        """Up to n products most similar to product_id, read from the precomputed neighbour table"""
+        if product_id not in self.positions:
+            raise ValueError(f"Product '{product_id}' not found")
+        if n > self.top_k:
+            raise ValueError(f"Only the top {self.top_k} neighbours are precomputed, got n={n}")
+
+        position = self.positions[product_id]
+        neighbours = self.neighbours[position, :n]
+        scores = self.neighbour_scores[position, :n]
+        return [self._product(int(i), similarity=float(score))
+                for i, score in zip(neighbours, scores) if np.isfinite(score)]
+
+    def get_trending_products(self, n=10):
+        """The n products with the highest trending score, best first"""
+        top = []
+        seen = set()
+        while self._trending_heap and len(top) < n:
+            entry = heapq.heappop(self._trending_heap)
+            if -entry[0] == self.trending_scores[entry[1]] and entry[1] not in seen:
+                top.append(entry)
+                seen.add(entry[1])
+        # Put the live entries back; the stale ones popped on the way stay dropped
+        for entry in top:
+            heapq.heappush(self._trending_heap, entry)
+        return [self._product(position, trending_score=-score, sales=float(self.sales[position]),
+                              rating=float(self.ratings[position])) for score, position in top]
+
+    def update_product(self, product_id, sales=None, rating=None):
+        """Refresh the trending score of one product after new orders or reviews"""
+        if product_id not in self.positions:
+            raise ValueError(f"Product '{product_id}' not found")
+
+        position = self.positions[product_id]
+        previous_sales, previous_rating = self.sales[position], self.ratings[position]
+        if sales is not None:
+            self.sales[position] = sales
+        if rating is not None:
+            self.ratings[position] = rating
+
+        # Scores are scaled by the catalog maxima, so moving a maximum rescales every product
+        if (max(previous_sales, self.sales[position]) >= self.max_sales or
+                max(previous_rating, self.ratings[position]) >= self.max_rating):
+            maxima = self._trending_maxima()
+            if maxima != (self.max_sales, self.max_rating):
+                self.max_sales, self.max_rating = maxima
+                self._rebuild_trending()
+                return
+
+        self.trending_scores[position] = self._trending_score(self.sales[position], self.ratings[position])
+        heapq.heappush(self._trending_heap, (-float(self.trending_scores[position]), position))
+
+        # Stale entries only cost memory; rebuild once they outnumber the live ones
+        if len(self._trending_heap) > 2 * len(self.product_ids):
+            self._rebuild_trending()
+
+    def get_category_distribution(self):
+        """Number of products in each category, largest first"""
+        return dict(self.category_counts)
+
+def _iter_dataset_chunks(path, chunk_size, columns=None, dtype=None):
+    """Yield a data file as DataFrames of at most chunk_size rows"""
+    if path.suffix == '.csv':
+        usecols = (lambda col: col in columns) if columns else None
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=usecols, dtype=dtype)
+    elif path.suffix in ('.json', '.jsonl'):
+        for chunk in pd.read_json(path, lines=True, chunksize=chunk_size, dtype=dtype):
+            if columns:
+                chunk = chunk[[col for col in chunk.columns if col in columns]]
+            yield chunk
+    elif path.suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        if columns:
+            columns = [col for col in parquet_file.schema_arrow.names if col in columns]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            chunk = batch.to_pandas()
+            if isinstance(dtype, dict):
+                # Like read_csv, ignore dtypes of columns that were pruned or are missing
+                chunk = chunk.astype({col: col_dtype for col, col_dtype in dtype.items() if col in chunk.columns})
+            elif dtype:
+                chunk = chunk.astype(dtype)
+            yield chunk
+
+
+def _hierarchical_embeddings(board_pins, board_children, pin_features, alpha=0.5, max_depth=3, pin_weights=None):
+    """Bottom-up hierarchical board embeddings.
+
+    A board's embedding mixes the mean of its direct pins with the mean of
+    its sub-boards' embeddings, and sub-boards deeper than max_depth count
+    as zero vectors. Each sweep moves one level up the hierarchy using the
+    previous sweep's child embeddings, so the loop stops after
+    min(max_depth, height) + 1 sweeps instead of re-walking every subtree.
+    pin_weights turns the pin mean into a weighted mean.
+    """
+    n_boards = board_pins.shape[0]
+    if pin_weights is not None:
+        board_pins = board_pins @ sparse.diags(pin_weights)
+
+    pin_counts = np.asarray(board_pins.sum(axis=1)).ravel()
+    child_counts = np.asarray(board_children.sum(axis=1)).ravel()
+    has_children = (child_counts > 0)[:, None]
+
+    # Row-normalized adjacency turns the pin and sub-board means into sparse products
+    pin_mean = sparse.diags(np.divide(1.0, pin_counts, out=np.zeros(n_boards), where=pin_counts > 0)) @ board_pins
+    child_mean = sparse.diags(np.divide(1.0, child_counts, out=np.zeros(n_boards), where=child_counts > 0)) @ board_children
+    direct = pin_mean @ pin_features
+
+    embeddings = np.zeros((n_boards, pin_features.shape[1]))
+    for _ in range(max_depth + 1):
+        updated = np.where(has_children, (1 - alpha) * direct + alpha * (child_mean @ embeddings), direct)
+        if np.array_equal(updated, embeddings):
+            break
+        embeddings = updated
+    return embeddings
+
+def _fit_cluster_model(embeddings, k, method='kmeans', random_seed=42, batch_size=1024):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if method == 'minibatch':
+        model = MiniBatchKMeans(n_clusters=k, random_state=random_seed, n_init=3, batch_size=batch_size)
+    else:
+        model = KMeans(n_clusters=k, random_state=random_seed, n_init=10)
+    return model.fit(embeddings)
+
+def _fit_category_model(features, n_clusters, method='kmeans', random_seed=42, chunk_size=10000, n_passes=3):
+    """KMeans, or MiniBatchKMeans streamed over chunks with partial_fit, for product categories"""
+    from sklearn.cluster import MiniBatchKMeans
+
+    if method not in ('kmeans', 'minibatch'):
+        raise ValueError(f"Unknown clustering method '{method}', expected 'kmeans' or 'minibatch'")
+    if method == 'kmeans':
+        return _fit_cluster_model(features, n_clusters, method, random_seed)
+
+    model = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_seed, n_init=3)
+    # The first partial_fit call initializes the centroids, so it needs at least n_clusters rows
+    chunk_size = max(chunk_size, n_clusters)
+    for _ in range(n_passes):
+        for start in range(0, len(features), chunk_size):
+            model.partial_fit(features[start:start + chunk_size])
+    return model
+
+def _csr_from_arrays(indptr, indices, shape):
+    # Memory-mapped index arrays are used as-is; only the all-ones data is allocated
+    return sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=shape)
+
+def _project_2d(embeddings, method='tsne', pca_components=50, random_seed=42):
+    """2-D coordinates for plotting: t-SNE after a PCA pre-reduction, or a plain 2-D PCA"""
+    from sklearn.decomposition import PCA
+    from sklearn.manifold import TSNE
+
+    if method not in ('tsne', 'pca'):
+        raise ValueError(f"Unknown projection '{method}', expected 'tsne' or 'pca'")
+    n_samples, n_dims = embeddings.shape
+    try:
+        if method == 'pca':
+            coordinates = PCA(n_components=min(2, n_samples, n_dims)).fit_transform(embeddings)
+            return np.pad(coordinates, ((0, 0), (0, 2 - coordinates.shape[1])))
+        if n_dims > pca_components and n_samples > pca_components:
+            embeddings = PCA(n_components=pca_components, random_state=random_seed).fit_transform(embeddings)
+        perplexity_value = min(5, n_samples - 1) if n_samples > 1 else 1
+        return TSNE(n_components=2, random_state=random_seed, perplexity=perplexity_value).fit_transform(embeddings)
+    except Exception as e:
+        logging.warning(f"{method} projection failed: {e}, skipping 2D embedding plots")
+        return np.zeros((n_samples, 2))
+
+def _fit_projection(features, n_components, method='pca', random_seed=42, chunk_size=10000):
+    """Fit a dimensionality reduction on a sparse feature matrix and return (model, reduced features)"""
+    from sklearn.decomposition import PCA, IncrementalPCA, TruncatedSVD
+
+    if method == 'pca':
+        model = PCA(n_components=n_components)
+        return model, model.fit_transform(features.toarray())
+    if method == 'svd':
+        # TruncatedSVD needs fewer components than columns
+        if n_components >= features.shape[1]:
+            return _fit_projection(features, n_components, 'pca', random_seed, chunk_size)
+        model = TruncatedSVD(n_components=n_components, algorithm='randomized', random_state=random_seed)
+        return model, model.fit_transform(features)
+    if method == 'incremental':
+        # Each batch densifies only chunk_size rows and must hold at least n_components of them
+        model = IncrementalPCA(n_components=n_components, batch_size=max(chunk_size, n_components))
+        model.fit(features)
+        return model, _project_in_chunks(model, features, chunk_size)
+    raise ValueError(f"Unknown projection '{method}', expected 'pca', 'svd' or 'incremental'")
+
+def _project_in_chunks(model, features, chunk_size=10000):
+    """Apply a fitted projection to sparse rows, densifying chunk_size rows at a time"""
+    from sklearn.decomposition import TruncatedSVD
+
+    if isinstance(model, TruncatedSVD):
+        return model.transform(features)
+    return np.vstack([model.transform(features[start:start + chunk_size].toarray())
+                      for start in range(0, features.shape[0], chunk_size)] or
+                     [np.zeros((0, model.n_components_))])
+
+def _predict_in_chunks(model, features, chunk_size=10000):
+    return np.concatenate([model.predict(features[start:start + chunk_size])
+                           for start in range(0, len(features), chunk_size)] or [np.zeros(0, dtype=int)])
+
+def _evaluate_k(embeddings, k, method, random_seed, batch_size=1024, silhouette_sample_size=None):
+    """Fit one k of the cluster search and return (model, silhouette score, seconds)"""
+    from sklearn.metrics import silhouette_score
+
+    start = time.perf_counter()
+    model = _fit_cluster_model(embeddings, k, method, random_seed, batch_size)
+    if silhouette_sample_size is not None and silhouette_sample_size >= len(embeddings):
+        silhouette_sample_size = None
+    score = silhouette_score(embeddings, model.labels_, sample_size=silhouette_sample_size, random_state=random_seed)
+    return model, score, time.perf_counter() - start
+
+def _interaction_positions(interactions, users, pins):
+    """User codes and pin positions of interaction rows (-1 for unknown users or pins)"""
+    user_codes = users.get_indexer(interactions['user_id'])
+    pin_positions = pins.get_indexer('pin_' + interactions['pin_id'].astype(str))
+    return user_codes, pin_positions
+
+def _user_board_matrix(user_codes, pin_positions, n_users, board_pins):
+    """Sparse boolean users x boards matrix of the boards holding each user's pins"""
+    known = (user_codes >= 0) & (pin_positions >= 0)
+    user_pins = sparse.csr_matrix(
+        (np.ones(known.sum()), (user_codes[known], pin_positions[known])),
+        shape=(n_users, board_pins.shape[1]))
+    return (user_pins @ board_pins.T).astype(bool).tocsr()
+
+def _score_users(query_boards, relevant_boards, index_positions, neighbours, neighbour_scores, n_index_boards,
+                 k_values, chunk_size=10000):
+    """Summed accuracy, hit ratio, MRR and NDCG over users with query and relevant boards"""
+    totals = {metric: {k: 0.0 for k in k_values} for metric in ['accuracy', 'hit_ratio', 'mrr', 'ndcg']}
+    evaluated = (query_boards.getnnz(axis=1) > 0) & (relevant_boards.getnnz(axis=1) > 0)
+    query_boards, relevant_boards = query_boards[evaluated], relevant_boards[evaluated]
+
+    # idcg_table[n] = ideal DCG with n relevant items ranked first
+    max_k = max(k_values)
+    discounts = 1.0 / np.log2(np.arange(max_k) + 2)
+    idcg_table = np.concatenate([[0.0], np.cumsum(discounts)])
+
+    for start in range(0, query_boards.shape[0], chunk_size):
+        queries = query_boards[start:start + chunk_size]
+        relevant = relevant_boards[start:start + chunk_size]
+        n_block = queries.shape[0]
+        n_relevant = relevant.getnnz(axis=1)
+
+        rows, cols = relevant.nonzero()
+        positions = index_positions[cols]
+        relevance = np.zeros((n_block, n_index_boards), dtype=bool)
+        relevance[rows[positions >= 0], positions[positions >= 0]] = True
+
+        # Each board keeps its best similarity over all of the user's query boards
+        rows, cols = queries.nonzero()
+        positions = index_positions[cols]
+        rows, positions = rows[positions >= 0], positions[positions >= 0]
+        merged = np.full((n_block, n_index_boards), -np.inf)
+        if neighbours.shape[1]:
+            candidate_users = np.repeat(rows, neighbours.shape[1])
+            candidate_boards = neighbours[positions].ravel()
+            candidate_scores = neighbour_scores[positions].ravel()
+            finite = np.isfinite(candidate_scores)
+            np.maximum.at(merged, (candidate_users[finite], candidate_boards[finite]), candidate_scores[finite])
+
+        ranked, ranked_scores = rank_rows(merged, max_k)
+        hits = np.take_along_axis(relevance, ranked, axis=1) & np.isfinite(ranked_scores)
+        n_ranked = hits.shape[1]
+
+        cumulative_hits = np.cumsum(hits, axis=1)
+        cumulative_dcg = np.cumsum(hits * discounts[:n_ranked], axis=1)
+        first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1), max_k)
+
+        for k in k_values:
+            column = min(k, n_ranked) - 1
+            k_hits = cumulative_hits[:, column] if column >= 0 else np.zeros(n_block)
+            dcg = cumulative_dcg[:, column] if column >= 0 else np.zeros(n_block)
+            idcg = idcg_table[np.minimum(n_relevant, k)]
+
+            totals['hit_ratio'][k] += np.sum(k_hits / n_relevant)
+            totals['accuracy'][k] += np.sum(k_hits / k)
+            totals['mrr'][k] += np.sum(np.where(first_hit < k, 1.0 / (first_hit + 1), 0.0))
+            totals['ndcg'][k] += np.sum(np.divide(dcg, idcg, out=np.zeros(n_block), where=idcg > 0))
+
+    return totals, int(evaluated.sum())
+
+def _average_metrics(totals, n_users):
+    return {metric: {k: total / n_users if n_users else 0 for k, total in by_k.items()}
+            for metric, by_k in totals.items()}
+
+# Per-process cross-validation state, set once by _init_fold_worker
+_fold_state = {}
+
+def _init_fold_worker(shared_name, pin_features_shape, board_pins, board_children):
+    shared = shared_memory.SharedMemory(name=shared_name)
+    _fold_state['shared'] = shared
+    _fold_state['pin_features'] = np.ndarray(pin_features_shape, dtype=float, buffer=shared.buf)
+    _fold_state['board_pins'] = board_pins
+    _fold_state['board_children'] = board_children
+
+def _run_fold(fold, n_users, alpha, max_depth, k_values):
+    """Retrain board embeddings on a fold's train interactions and score its test interactions"""
+    train_users, train_pins, test_users, test_pins = fold
+    board_pins = _fold_state['board_pins']
+    pin_features = _fold_state['pin_features']
+
+    known = train_pins >= 0
+    pin_weights = 1.0 + np.bincount(train_pins[known], minlength=board_pins.shape[1])
+    embeddings = _hierarchical_embeddings(board_pins, _fold_state['board_children'], pin_features,
+                                          alpha=alpha, max_depth=max_depth, pin_weights=pin_weights)
+
+    board_matrix = l2_normalize(embeddings)
+    valid = board_matrix.any(axis=1)
+    neighbours, neighbour_scores = board_neighbours(board_matrix, valid, max(k_values))
+
+    query_boards = _user_board_matrix(train_users, train_pins, n_users, board_pins)
+    relevant_boards = _user_board_matrix(test_users, test_pins, n_users, board_pins)
+    totals, evaluated = _score_users(query_boards, relevant_boards, np.arange(len(board_matrix)),
+                                     neighbours, neighbour_scores, len(board_matrix), k_values)
+    return _average_metrics(totals, evaluated)
+
+def _read_products(products):
+    """DataFrame of a product export given as a DataFrame, a list of dicts or a CSV/JSON file"""
+    if isinstance(products, pd.DataFrame):
+        return products.reset_index(drop=True)
+    if isinstance(products, (str, Path)):
+        path = Path(products)
+        if path.suffix == '.csv':
+            return pd.read_csv(path)
+        if path.suffix in ('.json', '.jsonl'):
+            return pd.read_json(path, lines=path.suffix == '.jsonl', dtype=False)
+        raise ValueError(f"Unsupported product export '{path.suffix}', expected .csv, .json or .jsonl")
+    return pd.DataFrame(list(products))
+
+def _export_value(value):
+    """Plain id or name from an exported field ({'$oid': ...} ids and populated {'name': ...} refs)"""
+    if isinstance(value, dict):
+        return value.get('name', value.get('$oid', value.get('_id')))
+    return value
+
+def _join_columns(df, columns, separator, with_names=False):
+    """Join the non-null values of several columns row-wise, column by column"""
+    joined = pd.Series('', index=df.index, dtype=object)
+    has_value = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        valid = df[col].notna().to_numpy()
+        values = df[col].astype(str)
+        if with_names:
+            values = f"{col}:" + values
+        glue = np.where(has_value & valid, separator, '')
+        joined = joined.where(~valid, joined + glue + values)
+        has_value |= valid
+    return joined
+
 def visualize_evaluation_results(results, k_values):
     """Visualize evaluation metrics"""
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(15, 10))
 
     metrics = ['accuracy', 'hit_ratio', 'mrr', 'ndcg']
@@ -632,6 +1633,8 @@ def visualize_evaluation_results(results, k_values):
 
 def run_pinsage_with_evaluation():
     """Run PinSage with evaluation"""
+    import kagglehub
+
     model = PinSageHierarchical(embedding_dim=16)
 
     try:
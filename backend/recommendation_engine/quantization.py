@@ -0,0 +1,191 @@
+"""Compressed vector codes for similarity search, using numpy only.
+
+Each codec is fitted on the (L2-normalized) vectors it will encode:
+
+    float16  2 bytes per dimension
+    int8     1 byte per dimension, scaled between each dimension's min and max
+    pq       product quantization: the vector is split into n_subspaces
+             chunks and each chunk is stored as the id of the closest of 256
+             centroids, so a vector costs n_subspaces bytes
+
+scores(query, codes) returns the approximate dot product of an exact query
+with every encoded vector. For pq this is asymmetric distance computation:
+the query is compared once with every centroid of every subspace, and each
+vector's score is the sum of n_subspaces table lookups.
+
+Approximate scores are only good for shortlisting; callers re-rank the best
+candidates on the exact vectors (see ann_index.QuantizedIndex and
+board_index.BoardIndex).
+"""
+import numpy as np
+
+CODECS = ('float16', 'int8', 'pq')
+
+
+class Float16Codec:
+    name = 'float16'
+
+    def fit(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float16)
+
+    def decode(self, codes):
+        return np.asarray(codes, dtype=np.float32)
+
+    def scores(self, query, codes, chunk_size=2048):
+        query = np.asarray(query, dtype=np.float32)
+        return np.concatenate([self.decode(codes[start:start + chunk_size]) @ query
+                               for start in range(0, len(codes), chunk_size)] or [np.zeros(0, dtype=np.float32)])
+
+    def arrays(self):
+        return {}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls()
+
+
+class Int8Codec:
+    name = 'int8'
+
+    def __init__(self, low=None, scale=None):
+        self.low = low
+        self.scale = scale
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0) if len(vectors) else np.zeros(vectors.shape[1], dtype=np.float32)
+        high = vectors.max(axis=0) if len(vectors) else self.low
+        self.scale = np.where(high > self.low, (high - self.low) / 255, 1).astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return np.clip(levels, 0, 255).astype(np.uint8)
+
+    def decode(self, codes):
+        return codes.astype(np.float32) * self.scale + self.low
+
+    def scores(self, query, codes, chunk_size=2048):
+        # q . (code * scale + low) == code . (q * scale) + q . low
+        query = np.asarray(query, dtype=np.float32)
+        scaled_query = query * self.scale
+        offset = float(query @ self.low)
+        return np.concatenate([codes[start:start + chunk_size].astype(np.float32) @ scaled_query + offset
+                               for start in range(0, len(codes), chunk_size)] or [np.zeros(0, dtype=np.float32)])
+
+    def arrays(self):
+        return {'low': self.low, 'scale': self.scale}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(np.asarray(arrays['low']), np.asarray(arrays['scale']))
+
+
+class PQCodec:
+    name = 'pq'
+
+    def __init__(self, n_subspaces=8, n_centroids=256, n_iter=10, train_size=10000, random_seed=42,
+                 codebooks=None, bounds=None):
+        self.n_subspaces = n_subspaces
+        self.n_centroids = n_centroids
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.random_seed = random_seed
+        self.codebooks = codebooks
+        self.bounds = bounds
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_subspaces = max(1, min(self.n_subspaces, vectors.shape[1]))
+        self.bounds = np.linspace(0, vectors.shape[1], n_subspaces + 1).astype(np.int64)
+
+        rng = np.random.default_rng(self.random_seed)
+        sample = vectors
+        if len(vectors) > self.train_size:
+            sample = vectors[np.sort(rng.choice(len(vectors), size=self.train_size, replace=False))]
+        if not len(sample):
+            # Nothing to train on; a zero centroid per subspace keeps encode/scores/save working
+            self.codebooks = [np.zeros((1, end - start), dtype=np.float32)
+                              for start, end in zip(self.bounds[:-1], self.bounds[1:])]
+            return self
+        n_centroids = min(self.n_centroids, 256, len(sample))
+        self.codebooks = [_kmeans(np.ascontiguousarray(sample[:, start:end]), n_centroids, self.n_iter, rng)
+                          for start, end in zip(self.bounds[:-1], self.bounds[1:])]
+        return self
+
+    def encode(self, vectors, chunk_size=2048):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), len(self.codebooks)), dtype=np.uint8)
+        for j, (start, end) in enumerate(zip(self.bounds[:-1], self.bounds[1:])):
+            for row in range(0, len(vectors), chunk_size):
+                codes[row:row + chunk_size, j] = _nearest(vectors[row:row + chunk_size, start:end], self.codebooks[j])
+        return codes
+
+    def decode(self, codes):
+        return np.hstack([codebook[codes[:, j]] for j, codebook in enumerate(self.codebooks)])
+
+    def scores(self, query, codes, chunk_size=2048):
+        query = np.asarray(query, dtype=np.float32)
+        # Lookup table of the query's dot product with every centroid of every subspace
+        tables = np.zeros((len(self.codebooks), 256), dtype=np.float32)
+        for j, (start, end) in enumerate(zip(self.bounds[:-1], self.bounds[1:])):
+            tables[j, :len(self.codebooks[j])] = self.codebooks[j] @ query[start:end]
+        subspaces = np.arange(len(self.codebooks))
+        return np.concatenate([tables[subspaces, codes[start:start + chunk_size]].sum(axis=1)
+                               for start in range(0, len(codes), chunk_size)] or [np.zeros(0, dtype=np.float32)])
+
+    def arrays(self):
+        arrays = {'bounds': self.bounds}
+        for j, codebook in enumerate(self.codebooks):
+            arrays[f'codebook_{j}'] = codebook
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        bounds = np.asarray(arrays['bounds'])
+        codebooks = [np.asarray(arrays[f'codebook_{j}']) for j in range(len(bounds) - 1)]
+        return cls(n_subspaces=len(codebooks), codebooks=codebooks, bounds=bounds)
+
+
+def create_codec(name, **params):
+    """Unfitted codec by name; params (n_subspaces, ...) only apply to pq"""
+    if name == 'float16':
+        return Float16Codec()
+    if name == 'int8':
+        return Int8Codec()
+    if name == 'pq':
+        return PQCodec(**params)
+    raise ValueError(f"Unknown quantization '{name}', expected one of {CODECS}")
+
+
+def load_codec(name, arrays):
+    """Fitted codec from the arrays its arrays() method returned"""
+    codecs = {'float16': Float16Codec, 'int8': Int8Codec, 'pq': PQCodec}
+    if name not in codecs:
+        raise ValueError(f"Unknown quantization '{name}', expected one of {CODECS}")
+    return codecs[name].from_arrays(arrays)
+
+
+def _nearest(vectors, centroids):
+    """Index of the closest centroid (Euclidean) for every vector"""
+    distances = (centroids * centroids).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+def _kmeans(vectors, n_clusters, n_iter, rng, chunk_size=2048):
+    """Lloyd's k-means, re-seeding empty clusters with random points"""
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.concatenate([_nearest(vectors[start:start + chunk_size], centroids)
+                                      for start in range(0, len(vectors), chunk_size)])
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.stack([np.bincount(assignments, weights=vectors[:, d], minlength=n_clusters)
+                         for d in range(vectors.shape[1])], axis=1).astype(np.float32)
+        empty = counts == 0
+        centroids = np.divide(sums, counts[:, None], out=centroids, where=~empty[:, None])
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+    return centroids
@@ -0,0 +1,210 @@
+"""Resident image similarity server.
+
+Keeps the ResNet feature extractor and the ANN index warm and answers JSON
+queries over HTTP on a local TCP port or a Unix socket:
+
+    GET  /health   -> {"status": "ok", "images": ..., "index": ..., ...}
+    POST /similar  {"image_path": "...", "num_results": 5, "n_probe": 8}
+                   -> {"results": [{"image_path", "label", "similarity"}, ...]}
+
+The optional search parameter is n_probe, search_k or rerank, whichever the
+server's --index uses; the others are ignored.
+
+Requests are served on separate threads. Each one decodes its own image and
+hands the tensor to a single batching thread that runs the CNN once for all
+queries that arrived within a short window.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from image_recognition import DEFAULT_STORE_PATH, get_model
+from inference import BACKENDS
+from quantization import CODECS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class MicroBatcher:
+    """Collects preprocessed images from request threads and embeds them in batches"""
+
+    def __init__(self, model, max_batch_size=16, max_wait_ms=5):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.images = 0
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def embed(self, image):
+        """Queue one (3, 224, 224) tensor and wait for its embedding"""
+        future = Future()
+        self.queue.put((image, future))
+        return future.result()
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        import torch
+
+        while True:
+            batch = self._next_batch()
+            futures = [future for _, future in batch]
+            try:
+                embeddings = self.model.embed_batch(torch.stack([image for image, _ in batch]))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            for future, embedding in zip(futures, embeddings):
+                future.set_result(embedding)
+
+
+class SimilarityRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'SimilarityServer/1.0'
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+            return
+        model = self.server.model
+        batcher = self.server.batcher
+        self._send_json(200, {
+            'status': 'ok',
+            'images': len(model.index),
+            'index': model.index_kind,
+            'batches': batcher.batches,
+            'embedded_images': batcher.images,
+            'uptime_seconds': round(time.monotonic() - self.server.started, 1)
+        })
+
+    def do_POST(self):
+        if self.path != '/similar':
+            self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            image_path = request['image_path']
+            num_results = int(request.get('num_results', 5))
+            search_params = {key: int(request[key]) for key in self.server.model.search_params if key in request}
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {'error': f"Invalid request: {e}"})
+            return
+
+        try:
+            start = time.perf_counter()
+            model = self.server.model
+            embedding = self.server.batcher.embed(model.preprocess(image_path))
+            results = model.find_similar_to_vector(embedding, num_results, **search_params)
+        except FileNotFoundError as e:
+            self._send_json(404, {'error': str(e)})
+            return
+        except Exception as e:
+            logging.error(f"Error processing {image_path}: {e}")
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self._send_json(200, {'results': results, 'elapsed_ms': (time.perf_counter() - start) * 1000})
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def create_server(model, host='127.0.0.1', port=8765, socket_path=None, max_batch_size=16, max_wait_ms=5):
+    """Create (but do not start) an HTTP server bound to a TCP port or a Unix socket"""
+    if socket_path:
+        server = ThreadingUnixHTTPServer(socket_path, SimilarityRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), SimilarityRequestHandler)
+    server.model = model
+    server.batcher = MicroBatcher(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server.started = time.monotonic()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve image similarity queries from a warm model')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--socket', default=None, help='Listen on this Unix socket path instead of TCP')
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help='Embedding store directory')
+    parser.add_argument('--n_probe', type=int, default=8, help='Default index partitions to scan per query')
+    parser.add_argument('--index', choices=('ivf', 'annoy') + CODECS, default='ivf',
+                        help='Index type; float16/int8/pq keep compressed vectors in memory')
+    parser.add_argument('--rerank', type=int, default=4,
+                        help='Candidates per result re-scored on exact vectors (quantized indexes)')
+    parser.add_argument('--backend', choices=BACKENDS, default='eager',
+                        help='CNN inference backend (see inference.py)')
+    parser.add_argument('--fast_decode', action='store_true',
+                        help='Decode query JPEGs at reduced resolution (match the catalog\'s setting)')
+    parser.add_argument('--max_batch_size', type=int, default=16, help='Most queries embedded in one forward pass')
+    parser.add_argument('--max_wait_ms', type=float, default=5, help='How long to wait for a batch to fill up')
+    parser.add_argument('--num_threads', type=int, default=None, help='Threads used by torch for the forward pass')
+    args = parser.parse_args()
+
+    if args.num_threads:
+        import torch
+        torch.set_num_threads(args.num_threads)
+
+    model = get_model(store_path=args.store, index=args.index, n_probe=args.n_probe, rerank=args.rerank,
+                      backend=args.backend, fast_decode=args.fast_decode)
+    # Load the CNN now so the first request doesn't pay for it
+    model.warm_up()
+
+    server = create_server(model, host=args.host, port=args.port, socket_path=args.socket,
+                           max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    address = args.socket or f"http://{args.host}:{args.port}"
+    logging.info(f"Serving {len(model.index)} images on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()